@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+准入控制
+每個端點一個並行上限 + 有界等待佇列，超過時拒絕請求（由應用返回 429 + Retry-After），
+讓服務在流量尖峰時可預期地降級，而不是無限制地累積工作
+"""
+
+import functools
+import math
+import threading
+import time
+
+
+class Saturated(Exception):
+    """並行名額已滿且等待佇列已滿（或等待逾時）"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} 請求過多，請稍後再試")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    """限制同時執行的請求數量；名額已滿時最多 max_queue 個請求排隊等待 queue_timeout 秒"""
+
+    def __init__(self, name, max_concurrent=8, max_queue=16, queue_timeout=10, retry_after=1):
+        self.name = name
+        # max_concurrent 為 0 時不限制
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.min_retry_after = retry_after
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # 請求處理時間的指數移動平均（估算 Retry-After）
+        self._avg_seconds = None
+
+    def retry_after(self):
+        """依目前排隊人數與平均處理時間估算建議的重試秒數"""
+        if not self._avg_seconds or not self.max_concurrent:
+            return self.min_retry_after
+        estimate = self._avg_seconds * (self.waiting + 1) / self.max_concurrent
+        return max(self.min_retry_after, math.ceil(estimate))
+
+    def reject(self, retry_after=None):
+        """記錄一次拒絕並返回 Saturated；retry_after 可由呼叫端依實際的下游積壓提供"""
+        with self._cond:
+            self.rejected += 1
+            return Saturated(self.name, max(self.min_retry_after, retry_after or self.retry_after()))
+
+    def acquire(self):
+        """取得名額，返回開始時間；無法取得時拋出 Saturated"""
+        with self._cond:
+            if self.max_concurrent and self.active >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    raise self.reject()
+                self.waiting += 1
+                try:
+                    admitted = self._cond.wait_for(lambda: self.active < self.max_concurrent, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not admitted:
+                    raise self.reject()
+            self.active += 1
+            self.admitted += 1
+        return time.perf_counter()
+
+    def release(self, started=None):
+        """釋放名額並記錄處理時間"""
+        with self._cond:
+            self.active -= 1
+            if started is not None:
+                seconds = time.perf_counter() - started
+                self._avg_seconds = seconds if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * seconds
+            self._cond.notify()
+
+    def limit(self, view):
+        """Flask view 裝飾器：取得名額後才執行；串流回應在輸出結束（或連線中斷）時才釋放"""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            started = self.acquire()
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                self.release(started)
+                raise
+            if getattr(response, "is_streamed", False):
+                response.call_on_close(lambda: self.release(started))
+            else:
+                self.release(started)
+            return response
+        return wrapper
+
+    def stats(self):
+        """獲取名額使用狀態"""
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_seconds": round(self._avg_seconds, 3) if self._avg_seconds is not None else None
+            }
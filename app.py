@@ -1,27 +1,91 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from transformers import pipeline
+from flask import Flask, render_template, request, jsonify, Response
 import json
 import os
+import time
 from datetime import datetime
 import uuid
 
+from version_store import VersionRepository
+from text_utils import clean_text
+from model_backend import ModelBackend, ModelNotReady, GenerationBatcher
+from model_server import ModelClient
+from generation_cache import parse_seed
+from app_common import (
+    create_common_blueprint, create_decomposition_store, create_generation_cache,
+    create_generate_limiter, create_legacy_file_sweeper
+)
+from generation_router import GenerationRouter, parse_routes
+from simple_content import generate_content_simple
+
 app = Flask(__name__)
 
-# 初始化 Hugging Face 模型（離線）
-# 使用更適合中文的模型
-generator = pipeline("text-generation", model="gpt2")
+# Hugging Face 模型（離線）：第一次使用時才載入，import app 不會載入模型
+# MODEL_WARMUP 開啟時，服務收到第一個請求就在背景預熱模型
+MODEL_NAME = os.environ.get("MODEL_NAME", "gpt2")
+MODEL_WARMUP = os.environ.get("MODEL_WARMUP", "true").lower() == "true"
+MODEL_LOAD_TIMEOUT = float(os.environ.get("MODEL_LOAD_TIMEOUT", "60"))
+MODEL_PREFIX_CACHE_SIZE = int(os.environ.get("MODEL_PREFIX_CACHE_SIZE", "32"))
+MODEL_QUANTIZATION = os.environ.get("MODEL_QUANTIZATION", "none")
+MODEL_TORCH_THREADS = int(os.environ.get("MODEL_TORCH_THREADS", "0"))
+model_backend = ModelBackend(
+    MODEL_NAME,
+    prefix_cache_size=MODEL_PREFIX_CACHE_SIZE,
+    quantization=MODEL_QUANTIZATION,
+    num_threads=MODEL_TORCH_THREADS
+)
+
+# 同時到達的 /generate 請求合併成一次批量生成
+GENERATE_MAX_BATCH_SIZE = int(os.environ.get("GENERATE_MAX_BATCH_SIZE", "8"))
+GENERATE_MAX_WAIT_MS = float(os.environ.get("GENERATE_MAX_WAIT_MS", "10"))
+generation_batcher = GenerationBatcher(
+    model_backend, GENERATE_MAX_BATCH_SIZE, GENERATE_MAX_WAIT_MS, load_timeout=MODEL_LOAD_TIMEOUT
+)
+
+# 設定 MODEL_SERVER_SOCKET 時改由共用的模型服務（model_server.py）生成，本程序不載入模型
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "")
+MODEL_SERVER_TIMEOUT = float(os.environ.get("MODEL_SERVER_TIMEOUT", "60"))
+MODEL_SERVER_AUTHKEY = os.environ.get("MODEL_SERVER_AUTHKEY", "").encode() or None
+model_client = (
+    ModelClient(MODEL_SERVER_SOCKET, MODEL_SERVER_TIMEOUT, MODEL_SERVER_AUTHKEY)
+    if MODEL_SERVER_SOCKET else None
+)
+generation = model_client or generation_batcher
+
+# 短形式可改用較小的模型（例如 distilgpt2），在本程序內延遲載入
+SMALL_MODEL_NAME = os.environ.get("SMALL_MODEL_NAME", "")
+small_model_backend = None
+small_generation_batcher = None
+if SMALL_MODEL_NAME:
+    small_model_backend = ModelBackend(
+        SMALL_MODEL_NAME,
+        prefix_cache_size=MODEL_PREFIX_CACHE_SIZE,
+        quantization=MODEL_QUANTIZATION,
+        num_threads=MODEL_TORCH_THREADS
+    )
+    small_generation_batcher = GenerationBatcher(
+        small_model_backend, GENERATE_MAX_BATCH_SIZE, GENERATE_MAX_WAIT_MS, load_timeout=MODEL_LOAD_TIMEOUT
+    )
+
+# 生成路由：「形式=後端」或「形式:長度=後端」，後端為 model（gpt2）、small（SMALL_MODEL_NAME）或 template
+GENERATION_ROUTES = os.environ.get("GENERATION_ROUTES", "")
 
-# 儲存版本紀錄
-versions = {}
+# 生成結果快取（預設關閉）：相同拆解內容與參數直接返回上次的結果，請求帶 fresh 時重新生成
+generation_cache = create_generation_cache()
 
-def clean_text(text):
-    """清理文字，去除多餘空格和亂碼"""
-    import re
-    # 去除多餘空格
-    text = re.sub(r'\s+', ' ', text)
-    # 去除特殊字符
-    text = re.sub(r'[^\w\s\u4e00-\u9fff。，！？；：""''（）【】]', '', text)
-    return text.strip()
+# 准入控制：名額與佇列都滿時返回 429 + Retry-After（設定見 app_common.py）
+generate_limiter = create_generate_limiter()
+
+# 儲存版本紀錄（以 confirmed_id 建立索引）
+versions = VersionRepository()
+
+# 確認後的拆解內容（SQLite + LRU 快取）與舊版檔案清理（第一個請求時才啟動），設定見 app_common.py
+decompositions = create_decomposition_store()
+legacy_file_sweeper = create_legacy_file_sweeper(decompositions)
+
+# 版本查詢／下載／匯出、429 處理與准入控制狀態
+app.register_blueprint(create_common_blueprint(
+    versions, lambda: {"generate": generate_limiter.stats()}, (legacy_file_sweeper,)
+))
 
 def detect_language(text):
     """簡單的語言檢測"""
@@ -56,10 +120,29 @@ def decompose_text(text):
     
     return decomposition
 
-def generate_content(decomposition, style, form, length):
-    """根據拆解內容和參數生成新文案"""
+# 各形式的生成設定：max_new_tokens 為「中」長度的 token 上限，
+# stop_on 為提前停止的結尾（短形式寫完一句或換行就停止）
+GENERATION_FORMS = {
+    "社群貼文": {"max_new_tokens": 120, "stop_on": ("\n\n",)},
+    "Email標題": {"max_new_tokens": 32, "stop_on": ("\n", "。", "！", "？", "!", "?")},
+    "完整文章": {"max_new_tokens": 400, "stop_on": ()}
+}
+
+LENGTH_TOKEN_SCALE = {
+    "短": 0.5,
+    "中": 1.0,
+    "長": 1.5
+}
+
+# 新產生 token 數的上限；模型端另會依提示詞長度縮減，兩者合計不超過上下文長度（gpt2 為 1024）
+GENERATE_MAX_NEW_TOKENS = int(os.environ.get("GENERATE_MAX_NEW_TOKENS", "512"))
+
+# 提示詞中關鍵要點的字數上限（中文在 gpt2 約 2 個 token 一字，過長的要點會佔去生成的空間）
+PROMPT_KEY_POINTS_MAX_CHARS = int(os.environ.get("PROMPT_KEY_POINTS_MAX_CHARS", "200"))
+
+def build_prompt_prefix(style, form, length):
+    """提示詞中固定的指示部分（相同風格、形式、長度共用，模型端可重用其 KV 快取）"""
     
-    # 構建提示詞
     style_map = {
         "活潑": "活潑有趣的風格",
         "專業": "專業嚴謹的風格", 
@@ -79,42 +162,152 @@ def generate_content(decomposition, style, form, length):
         "長": "500字以上"
     }
     
-    prompt = f"""
+    return f"""
     請根據以下拆解內容，生成一段{style_map.get(style, style)}的{form_map.get(form, form)}，
     字數要求：{length_map.get(length, length)}。
     
     拆解內容：
+"""
+
+def build_prompt(decomposition, style, form, length):
+    """根據拆解內容和參數構建提示詞"""
+    key_points = ', '.join(decomposition['key_points'])
+    if len(key_points) > PROMPT_KEY_POINTS_MAX_CHARS:
+        key_points = key_points[:PROMPT_KEY_POINTS_MAX_CHARS] + "..."
+    prompt = build_prompt_prefix(style, form, length) + f"""\
     標題：{decomposition['title_suggestion']}
     目標受眾：{decomposition['audience']}
     目的：{decomposition['purpose']}
     語調：{decomposition['tone']}
-    關鍵要點：{', '.join(decomposition['key_points'])}
+    關鍵要點：{key_points}
     
     請生成符合要求的文案：
     """
     
-    # 使用模型生成
+    return prompt
+
+def generation_kwargs(form, length, seed=None):
+    """依形式與長度決定模型生成參數（只返回新產生的文字）；指定 seed 時取樣結果可重現"""
+    form_info = GENERATION_FORMS.get(form, GENERATION_FORMS["完整文章"])
+    max_new_tokens = int(form_info["max_new_tokens"] * LENGTH_TOKEN_SCALE.get(length, 1.0))
+    max_new_tokens = max(8, min(max_new_tokens, GENERATE_MAX_NEW_TOKENS))
+    kwargs = {
+        "max_new_tokens": max_new_tokens,
+        "stop_on": form_info["stop_on"],
+        "return_full_text": False,
+        "num_return_sequences": 1,
+        "do_sample": True,
+        "temperature": 0.8
+    }
+    if seed is not None:
+        kwargs["seed"] = seed
+    return kwargs
+
+def _submit_prompt(submitter, decomposition, style, form, length, seed=None):
+    """構建提示詞並交給模型生成（與其他同時到達的請求合併批次）"""
+    prompt = build_prompt(decomposition, style, form, length)
+    prefix = build_prompt_prefix(style, form, length)
+    return submitter.submit(prompt, prefix=prefix, **generation_kwargs(form, length, seed))
+
+def generate_with_model(decomposition, style, form, length, seed=None):
+    """以 gpt2（或共用的模型服務）生成"""
+    return _submit_prompt(generation, decomposition, style, form, length, seed)
+
+def generate_with_small_model(decomposition, style, form, length, seed=None):
+    """以小模型生成"""
+    return _submit_prompt(small_generation_batcher, decomposition, style, form, length, seed)
+
+def generate_content_template(decomposition, style, form, length, seed=None):
+    """以模板引擎生成（與簡化版本共用模板，不需要載入模型，結果與 seed 無關）"""
+    return generate_content_simple(decomposition, style, form, length)
+
+generation_backends = {
+    "model": generate_with_model,
+    "template": generate_content_template
+}
+if small_generation_batcher is not None:
+    generation_backends["small"] = generate_with_small_model
+generation_router = GenerationRouter(generation_backends, parse_routes(GENERATION_ROUTES), default="model")
+
+def generate_content(decomposition, style, form, length, seed=None, fresh=False):
+    """根據拆解內容和參數生成新文案（開啟快取時相同參數返回上次的結果）"""
+    cache_key = generation_cache.make_key(decomposition, style, form, length, seed=seed)
+    cached = generation_cache.get(cache_key, bypass=fresh)
+    if cached is not None:
+        return cached
+    
+    # 依形式與長度選擇生成後端（模型未就緒時拋出 ModelNotReady）
     try:
-        result = generator(
-            prompt,
-            max_length=300,
-            num_return_sequences=1,
-            do_sample=True,
-            temperature=0.8
-        )[0]["generated_text"]
+        _, result = generation_router.generate(decomposition, style, form, length, seed=seed)
         
         # 清理生成結果
-        generated_text = result.replace(prompt, "").strip()
+        generated_text = result.strip()
         if not generated_text:
-            generated_text = "無法生成文案，請重試。"
-            
+            return "無法生成文案，請重試。"
+        
+        generation_cache.set(cache_key, generated_text)
         return generated_text
+    except ModelNotReady:
+        raise
     except Exception as e:
         return f"生成失敗：{str(e)}"
 
+def start_model_warmup():
+    """在背景執行緒預熱模型（使用模型服務時由服務自行載入）"""
+    if not MODEL_WARMUP:
+        return
+    if model_client is None:
+        model_backend.warmup()
+    if small_model_backend is not None:
+        small_model_backend.warmup()
+
+def get_model_status():
+    """模型載入狀態與批次統計"""
+    if model_client is not None:
+        status = model_client.status()
+    else:
+        status = model_backend.status()
+        status["batching"] = generation_batcher.stats()
+    if small_model_backend is not None:
+        status["small_model"] = small_model_backend.status()
+        status["small_model"]["batching"] = small_generation_batcher.stats()
+    status["routing"] = generation_router.stats()
+    status["generation_cache"] = generation_cache.stats()
+    return status
+
+def save_version(confirmed_id, style, form, length, generated_text):
+    """儲存版本紀錄"""
+    version_data = {
+        "id": str(uuid.uuid4()),
+        "confirmed_id": confirmed_id,
+        "timestamp": datetime.now().isoformat(),
+        "style": style,
+        "form": form,
+        "length": length,
+        "generated_text": generated_text
+    }
+    versions.add(version_data)
+    return version_data
+
+def format_stream_event(event, data):
+    """將事件格式化為 SSE"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.before_request
+def warmup_on_first_request():
+    """服務開始處理請求時預熱模型，不阻塞目前的請求"""
+    if model_client is None and model_backend.state == "not_loaded":
+        start_model_warmup()
+
 @app.route("/")
 def index():
-    return render_template("index.html")
+    return render_template("index.html", streaming_enabled=True)
+
+@app.route("/api/model/status")
+def model_status():
+    """模型就緒狀態（模型未就緒時返回 503，可作為 readiness 檢查）"""
+    status = get_model_status()
+    return jsonify(status), (200 if status["state"] == "ready" else 503)
 
 @app.route("/decompose", methods=["POST"])
 def decompose():
@@ -153,48 +346,47 @@ def confirm():
         "decomposition": decomposition
     }
     
-    # 儲存到檔案（實際應用中可以使用資料庫）
-    with open(f"confirmed_{confirmed_id}.json", "w", encoding="utf-8") as f:
-        json.dump(confirmed_data, f, ensure_ascii=False, indent=2)
+    # 儲存到拆解內容儲存（SQLite + LRU 快取）
+    decompositions.save(confirmed_data)
     
     return jsonify({"confirmed_id": confirmed_id})
 
 @app.route("/generate", methods=["POST"])
+@generate_limiter.limit
 def generate():
     """Step 3: 生成新文案"""
     confirmed_id = request.json.get("confirmed_id")
     style = request.json.get("style", "專業")
     form = request.json.get("form", "完整文章")
     length = request.json.get("length", "中")
+    fresh = bool(request.json.get("fresh", False))
+    try:
+        seed = parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    return generate_version(confirmed_id, style, form, length, seed, fresh)
+
+def generate_version(confirmed_id, style, form, length, seed=None, fresh=False):
+    """生成文案並儲存版本紀錄"""
     # 讀取確認的拆解內容
-    try:
-        with open(f"confirmed_{confirmed_id}.json", "r", encoding="utf-8") as f:
-            confirmed_data = json.load(f)
-    except FileNotFoundError:
+    confirmed_data = decompositions.get(confirmed_id)
+    if confirmed_data is None:
         return jsonify({"error": "找不到確認的拆解內容"}), 404
     
     decomposition = confirmed_data["decomposition"]
     
     # 生成新文案
-    generated_text = generate_content(decomposition, style, form, length)
+    try:
+        generated_text = generate_content(decomposition, style, form, length, seed, fresh)
+    except ModelNotReady as e:
+        return jsonify({"error": str(e), "model": get_model_status()}), 503
     
     # 儲存版本紀錄
-    version_id = str(uuid.uuid4())
-    version_data = {
-        "id": version_id,
-        "confirmed_id": confirmed_id,
-        "timestamp": datetime.now().isoformat(),
-        "style": style,
-        "form": form,
-        "length": length,
-        "generated_text": generated_text
-    }
-    
-    versions[version_id] = version_data
+    version_data = save_version(confirmed_id, style, form, length, generated_text)
     
     return jsonify({
-        "version_id": version_id,
+        "version_id": version_data["id"],
         "generated_text": generated_text,
         "metadata": {
             "style": style,
@@ -204,52 +396,127 @@ def generate():
         }
     })
 
-@app.route("/versions/<confirmed_id>")
-def get_versions(confirmed_id):
-    """獲取特定拆解內容的所有版本"""
-    user_versions = [v for v in versions.values() if v["confirmed_id"] == confirmed_id]
-    return jsonify(user_versions)
-
-@app.route("/download/<version_id>")
-def download_version(version_id):
-    """下載特定版本的文案"""
-    if version_id not in versions:
-        return jsonify({"error": "版本不存在"}), 404
-    
-    version = versions[version_id]
-    filename = f"文案_{version['style']}_{version['form']}_{version['timestamp'][:10]}.txt"
-    
-    # 創建臨時檔案
-    temp_file = f"temp_{filename}"
-    with open(temp_file, "w", encoding="utf-8") as f:
-        f.write(f"文案內容：\n{version['generated_text']}\n\n")
-        f.write(f"生成參數：\n")
-        f.write(f"風格：{version['style']}\n")
-        f.write(f"形式：{version['form']}\n")
-        f.write(f"長度：{version['length']}\n")
-        f.write(f"生成時間：{version['timestamp']}\n")
-    
-    return send_file(temp_file, as_attachment=True, download_name=filename)
+@app.route("/generate/stream", methods=["POST"])
+@generate_limiter.limit
+def generate_stream():
+    """Step 3（串流）：以 Server-Sent Events 逐段推送生成的文字，完成後寫入版本紀錄"""
+    confirmed_id = request.json.get("confirmed_id")
+    style = request.json.get("style", "專業")
+    form = request.json.get("form", "完整文章")
+    length = request.json.get("length", "中")
+    fresh = bool(request.json.get("fresh", False))
+    try:
+        seed = parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    confirmed_data = decompositions.get(confirmed_id)
+    if confirmed_data is None:
+        return jsonify({"error": "找不到確認的拆解內容"}), 404
+    
+    decomposition = confirmed_data["decomposition"]
+    cache_key = generation_cache.make_key(decomposition, style, form, length, seed=seed)
+    cached = generation_cache.get(cache_key, bypass=fresh)
+    
+    route = None
+    started = time.perf_counter()
+    if cached is not None:
+        # 快取命中時一次送出完整結果
+        chunks = iter([cached])
+    elif generation_router.route(form, length) == "template":
+        route = "template"
+        chunks = iter([generate_content_template(decomposition, style, form, length)])
+    else:
+        route = generation_router.route(form, length)
+        prompt = build_prompt(decomposition, style, form, length)
+        kwargs = generation_kwargs(form, length, seed)
+        kwargs["prefix"] = build_prompt_prefix(style, form, length)
+        
+        # 串流不經過批次處理；模型未就緒時在開始回應前返回 503
+        streaming = small_model_backend if route == "small" else (model_client or model_backend)
+        try:
+            chunks = streaming.stream(prompt, timeout=MODEL_LOAD_TIMEOUT, **kwargs)
+        except ModelNotReady as e:
+            generation_router.record(route)
+            return jsonify({"error": str(e), "model": get_model_status()}), 503
+    
+    def events():
+        parts = []
+        try:
+            for text in chunks:
+                parts.append(text)
+                yield format_stream_event("token", {"text": text})
+        except Exception as e:
+            if route:
+                generation_router.record(route)
+            yield format_stream_event("error", {"error": f"生成失敗：{str(e)}"})
+            return
+        finally:
+            # 客戶端斷線時關閉模型的串流，停止生成
+            if hasattr(chunks, "close"):
+                chunks.close()
+        
+        if route:
+            generation_router.record(route, time.perf_counter() - started)
+        generated_text = "".join(parts).strip()
+        if generated_text:
+            generation_cache.set(cache_key, generated_text)
+        else:
+            generated_text = "無法生成文案，請重試。"
+        version_data = save_version(confirmed_id, style, form, length, generated_text)
+        yield format_stream_event("done", {
+            "version_id": version_data["id"],
+            "generated_text": generated_text,
+            "metadata": {
+                "style": style,
+                "form": form,
+                "length": length,
+                "timestamp": version_data["timestamp"]
+            }
+        })
+    
+    return Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
 
 @app.route("/regenerate", methods=["POST"])
+@generate_limiter.limit
 def regenerate():
     """重新生成文案（同參數或改參數）"""
     confirmed_id = request.json.get("confirmed_id")
     style = request.json.get("style")
     form = request.json.get("form")
     length = request.json.get("length")
+    try:
+        seed = parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # 如果沒有提供新參數，使用最後一個版本的參數
     if not all([style, form, length]):
-        user_versions = [v for v in versions.values() if v["confirmed_id"] == confirmed_id]
-        if user_versions:
-            last_version = max(user_versions, key=lambda x: x["timestamp"])
+        last_version = versions.latest(confirmed_id)
+        if last_version:
             style = style or last_version["style"]
             form = form or last_version["form"]
             length = length or last_version["length"]
     
-    # 調用生成函數
-    return generate()
+    # 以補齊後的參數生成
+    return generate_version(
+        confirmed_id,
+        style or "專業",
+        form or "完整文章",
+        length or "中",
+        seed,
+        bool(request.json.get("fresh", False))
+    )
 
 if __name__ == "__main__":
+    # 開發伺服器的 reloader 監控程序不載入模型，只在實際服務的子程序預熱
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_model_warmup()
     app.run(debug=True)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+三個版本共用的應用元件
+拆解內容儲存、舊檔清理、生成快取與准入控制的環境變數設定在這裡讀取一次；
+版本查詢／下載／匯出、429 處理、准入控制狀態與背景工作的啟動由 create_common_blueprint 註冊
+"""
+
+import os
+
+from flask import Blueprint, Response, jsonify, request
+
+from admission_control import ConcurrencyLimiter, Saturated
+from decomposition_store import DecompositionStore
+from download_utils import attachment_headers, version_filename, format_version_text, export_versions
+from file_sweeper import LegacyFileSweeper
+from generation_cache import GenerationCache
+
+# 確認後的拆解內容（DECOMPOSITION_DB 設為空字串時只保存在記憶體）
+DECOMPOSITION_DB = os.environ.get("DECOMPOSITION_DB", "confirmed.db")
+DECOMPOSITION_CACHE_SIZE = int(os.environ.get("DECOMPOSITION_CACHE_SIZE", "1024"))
+
+# 舊版檔案的保留秒數與清理間隔（0 表示不清理）
+LEGACY_FILE_RETENTION = float(os.environ.get("LEGACY_FILE_RETENTION", str(7 * 86400)))
+LEGACY_SWEEP_INTERVAL = float(os.environ.get("LEGACY_SWEEP_INTERVAL", "3600"))
+
+# 生成結果快取（預設關閉）：相同拆解內容與參數直接返回上次的結果，請求帶 fresh 時重新生成
+GENERATION_CACHE = os.environ.get("GENERATION_CACHE", "false").lower() == "true"
+GENERATION_CACHE_SIZE = int(os.environ.get("GENERATION_CACHE_SIZE", "1024"))
+GENERATION_CACHE_TTL = float(os.environ.get("GENERATION_CACHE_TTL", "3600")) or None
+
+# 准入控制：每個端點的並行上限與等待佇列，名額與佇列都滿時返回 429 + Retry-After（並行上限設為 0 表示不限制）
+GENERATE_CONCURRENCY = int(os.environ.get("GENERATE_CONCURRENCY", "8"))
+GENERATE_ADMISSION_QUEUE = int(os.environ.get("GENERATE_ADMISSION_QUEUE", "32"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "1"))
+
+
+def create_decomposition_store():
+    """確認後的拆解內容儲存（SQLite + LRU 快取，舊版 confirmed_<id>.json 在第一次讀取時匯入）"""
+    return DecompositionStore(DECOMPOSITION_DB, DECOMPOSITION_CACHE_SIZE)
+
+
+def create_legacy_file_sweeper(decompositions):
+    """清理舊版下載留下的 temp_文案_*.txt 暫存檔與 confirmed_*.json（需先匯入資料庫才會刪除）"""
+    return LegacyFileSweeper(
+        patterns=("temp_文案_*.txt", "confirmed_*.json"),
+        retention=LEGACY_FILE_RETENTION,
+        interval=LEGACY_SWEEP_INTERVAL,
+        before_remove=lambda path: not path.endswith(".json") or decompositions.import_legacy_file(path)
+    )
+
+
+def create_generation_cache():
+    return GenerationCache(GENERATION_CACHE_SIZE, GENERATION_CACHE_TTL, GENERATION_CACHE)
+
+
+def create_limiter(name, max_concurrent, max_queue):
+    """建立端點的准入控制（等待逾時與最短 Retry-After 使用共用設定）"""
+    return ConcurrencyLimiter(name, max_concurrent, max_queue, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER)
+
+
+def create_generate_limiter():
+    return create_limiter("generate", GENERATE_CONCURRENCY, GENERATE_ADMISSION_QUEUE)
+
+
+def create_common_blueprint(versions, admission_stats, background_tasks=()):
+    """
+    建立共用路由
+    versions 為 VersionRepository；admission_stats() 返回 /api/admission/stats 的內容；
+    background_tasks 中每個物件的 start() 在第一個請求時呼叫（import 時不啟動執行緒）
+    """
+    bp = Blueprint("common", __name__)
+
+    @bp.before_app_request
+    def start_background_tasks():
+        for task in background_tasks:
+            task.start()
+
+    @bp.app_errorhandler(Saturated)
+    def handle_saturated(e):
+        """名額與等待佇列都已滿時返回 429，並以 Retry-After 告知建議的重試秒數"""
+        response = jsonify({"error": "伺服器忙碌中，請稍後再試", "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+
+    @bp.route("/api/admission/stats")
+    def get_admission_stats():
+        """獲取各端點的准入控制狀態"""
+        return jsonify(admission_stats())
+
+    @bp.route("/versions/<confirmed_id>")
+    def get_versions(confirmed_id):
+        """獲取特定拆解內容的所有版本"""
+        return jsonify(versions.by_confirmed_id(confirmed_id))
+
+    @bp.route("/versions/<confirmed_id>/export")
+    def export_confirmed_versions(confirmed_id):
+        """一次匯出特定拆解內容的所有版本（?format=zip|ndjson|csv，以串流方式輸出）"""
+        fmt = request.args.get("format", "zip")
+        version_list = versions.by_confirmed_id(confirmed_id)
+        if not version_list:
+            return jsonify({"error": "找不到版本紀錄"}), 404
+
+        export = export_versions(version_list, fmt)
+        if export is None:
+            return jsonify({"error": "不支援的匯出格式"}), 400
+
+        body, mimetype = export
+        return Response(
+            body,
+            mimetype=mimetype,
+            headers=attachment_headers(f"文案_{confirmed_id[:8]}.{fmt}")
+        )
+
+    @bp.route("/download/<version_id>")
+    def download_version(version_id):
+        """下載特定版本的文案（在記憶體中產生，不寫入暫存檔）"""
+        if version_id not in versions:
+            return jsonify({"error": "版本不存在"}), 404
+
+        version = versions[version_id]
+        return Response(
+            format_version_text(version),
+            mimetype="text/plain",
+            headers=attachment_headers(version_filename(version))
+        )
+
+    return bp
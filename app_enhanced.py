@@ -5,318 +5,190 @@ AI 文案生成工具 - 增強版本
 實現 readme 中的未來規劃功能
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, Response
 import json
 import os
-import re
 from datetime import datetime
+import time
 import uuid
 import random
 import zipfile
-from io import BytesIO
+import queue
+
+from batch_executor import BatchExecutor, ShardedProcessPool
+from job_store import create_job_store, JobUpdateNotifier, JobHeartbeat, FINISHED_STATUSES
+from version_store import VersionRepository
+from download_utils import attachment_headers, ZipStreamBuffer
+from lru_cache import LRUCache
+from enhanced_content import SUPPORTED_LANGUAGES, ENHANCED_STYLES, ENHANCED_FORMS
+from batch_worker import prepare_batch_texts, process_batch_item, process_batch_chunk, cached_analysis, cached_generation
+from generation_cache import parse_seed
+from app_common import (
+    create_common_blueprint, create_decomposition_store, create_generation_cache,
+    create_generate_limiter, create_legacy_file_sweeper, create_limiter
+)
 
 app = Flask(__name__)
 
-# 儲存版本紀錄
-versions = {}
-batch_jobs = {}
-
-# 支援的語言列表
-SUPPORTED_LANGUAGES = {
-    "中文": "zh",
-    "英文": "en", 
-    "日文": "ja",
-    "韓文": "ko",
-    "法文": "fr",
-    "德文": "de",
-    "西班牙文": "es",
-    "葡萄牙文": "pt",
-    "義大利文": "it",
-    "俄文": "ru"
-}
+# 儲存版本紀錄（以 confirmed_id 建立索引）
+versions = VersionRepository()
 
-# 擴展的文案風格
-ENHANCED_STYLES = {
-    "活潑": {
-        "description": "適合年輕族群，使用輕鬆活潑的語言",
-        "emoji": "🎉",
-        "tone": "輕鬆、有趣、充滿活力"
-    },
-    "專業": {
-        "description": "適合商業場合，使用正式專業的語言",
-        "emoji": "💼",
-        "tone": "嚴謹、專業、可信賴"
-    },
-    "學術": {
-        "description": "適合研究報告，使用嚴謹學術的語言",
-        "emoji": "📚",
-        "tone": "嚴謹、客觀、學術性"
-    },
-    "幽默": {
-        "description": "適合娛樂場合，使用風趣幽默的語言",
-        "emoji": "😂",
-        "tone": "風趣、幽默、輕鬆"
-    },
-    "溫馨": {
-        "description": "適合情感表達，使用溫暖親切的語言",
-        "emoji": "💝",
-        "tone": "溫暖、親切、關懷"
-    },
-    "激勵": {
-        "description": "適合鼓舞人心，使用激勵性的語言",
-        "emoji": "🔥",
-        "tone": "激勵、鼓舞、正能量"
-    },
-    "神秘": {
-        "description": "適合懸疑內容，使用神秘吸引的語言",
-        "emoji": "🔮",
-        "tone": "神秘、吸引、懸疑"
-    },
-    "優雅": {
-        "description": "適合高端場合，使用優雅精緻的語言",
-        "emoji": "✨",
-        "tone": "優雅、精緻、高端"
-    }
-}
+# 確認後的拆解內容（SQLite + LRU 快取）與舊版檔案清理（第一個請求時才啟動），設定見 app_common.py
+decompositions = create_decomposition_store()
+legacy_file_sweeper = create_legacy_file_sweeper(decompositions)
 
-# 擴展的文案形式
-ENHANCED_FORMS = {
-    "社群貼文": {
-        "description": "適合社群媒體的短文案，吸引眼球",
-        "max_length": 200,
-        "hashtag_support": True
-    },
-    "Email標題": {
-        "description": "吸引人的Email標題，提高開信率",
-        "max_length": 100,
-        "hashtag_support": False
-    },
-    "完整文章": {
-        "description": "完整的文章內容，詳細說明",
-        "max_length": 1000,
-        "hashtag_support": False
-    },
-    "廣告文案": {
-        "description": "商業廣告文案，突出賣點",
-        "max_length": 300,
-        "hashtag_support": True
-    },
-    "新聞稿": {
-        "description": "正式的新聞發布稿",
-        "max_length": 500,
-        "hashtag_support": False
-    },
-    "產品描述": {
-        "description": "產品功能與特色描述",
-        "max_length": 400,
-        "hashtag_support": True
-    },
-    "活動宣傳": {
-        "description": "活動推廣與宣傳文案",
-        "max_length": 350,
-        "hashtag_support": True
+# 拆解結果快取（以原始文字與指定語言的雜湊為鍵）
+DECOMPOSE_CACHE_SIZE = int(os.environ.get("DECOMPOSE_CACHE_SIZE", "4096"))
+decompose_cache = LRUCache(DECOMPOSE_CACHE_SIZE)
+
+# 生成結果快取（預設關閉）：相同拆解內容與參數直接返回上次的結果，請求帶 fresh 時重新生成
+generation_cache = create_generation_cache()
+
+# 准入控制：名額與佇列都滿時返回 429 + Retry-After（設定見 app_common.py）
+generate_limiter = create_generate_limiter()
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "2"))
+BATCH_ADMISSION_QUEUE = int(os.environ.get("BATCH_ADMISSION_QUEUE", "4"))
+batch_limiter = create_limiter("batch", BATCH_CONCURRENCY, BATCH_ADMISSION_QUEUE)
+
+# 批量任務儲存：預設使用 SQLite（重啟後保留），BATCH_JOB_DB 設為空字串時改用記憶體
+BATCH_JOB_DB = os.environ.get("BATCH_JOB_DB", "batch_jobs.db")
+BATCH_JOB_CACHE_SIZE = int(os.environ.get("BATCH_JOB_CACHE_SIZE", "32"))
+batch_jobs = create_job_store(BATCH_JOB_DB, BATCH_JOB_CACHE_SIZE)
+
+# 有新結果或狀態改變時通知同一進程內、串流同一任務的連線
+batch_updates = JobUpdateNotifier()
+
+# 工作進程心跳：超過 BATCH_JOB_STALE_AFTER 秒沒有心跳的進程留下的未完成任務標記為失敗
+BATCH_JOB_STALE_AFTER = float(os.environ.get("BATCH_JOB_STALE_AFTER", "60"))
+batch_job_heartbeat = JobHeartbeat(batch_jobs, BATCH_JOB_STALE_AFTER, on_orphaned=batch_updates.notify)
+
+# 批量任務執行器設定
+BATCH_MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "4"))
+BATCH_MAX_QUEUE = int(os.environ.get("BATCH_MAX_QUEUE", "100"))
+batch_executor = BatchExecutor(BATCH_MAX_WORKERS, BATCH_MAX_QUEUE)
+
+# 版本查詢／下載／匯出、429 處理、准入控制狀態與背景工作（心跳、舊檔清理）的啟動
+app.register_blueprint(create_common_blueprint(
+    versions,
+    lambda: {
+        "generate": generate_limiter.stats(),
+        "batch": batch_limiter.stats(),
+        "batch_executor": batch_executor.stats()
     },
-    "品牌故事": {
-        "description": "品牌理念與故事敘述",
-        "max_length": 600,
-        "hashtag_support": False
-    }
-}
+    (batch_job_heartbeat, legacy_file_sweeper)
+))
 
-def clean_text(text):
-    """清理文字，去除多餘空格和亂碼"""
-    # 去除多餘空格
-    text = re.sub(r'\s+', ' ', text)
-    # 去除特殊字符
-    text = re.sub(r'[^\w\s\u4e00-\u9fff。，！？；：""''（）【】]', '', text)
-    return text.strip()
-
-def detect_language_enhanced(text):
-    """增強的語言檢測"""
-    # 語言特徵檢測
-    language_scores = {}
-    
-    # 中文檢測
-    chinese_chars = len([c for c in text if '\u4e00' <= c <= '\u9fff'])
-    language_scores['中文'] = chinese_chars
-    
-    # 英文檢測
-    english_chars = len([c for c in text if c.isalpha() and ord(c) < 128])
-    language_scores['英文'] = english_chars
-    
-    # 日文檢測
-    japanese_chars = len([c for c in text if '\u3040' <= c <= '\u309f' or '\u30a0' <= c <= '\u30ff'])
-    language_scores['日文'] = japanese_chars
-    
-    # 韓文檢測
-    korean_chars = len([c for c in text if '\uac00' <= c <= '\ud7af'])
-    language_scores['韓文'] = korean_chars
-    
-    # 返回得分最高的語言
-    detected_lang = max(language_scores, key=language_scores.get)
-    confidence = language_scores[detected_lang] / max(1, len(text))
-    
-    return detected_lang, confidence
+# 大型批量任務的多進程分片設定
+BATCH_PROCESS_WORKERS = int(os.environ.get("BATCH_PROCESS_WORKERS", str(os.cpu_count() or 1)))
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "500"))
+BATCH_SHARD_THRESHOLD = int(os.environ.get("BATCH_SHARD_THRESHOLD", "2000"))
+batch_process_pool = ShardedProcessPool(BATCH_PROCESS_WORKERS, BATCH_CHUNK_SIZE)
 
-def decompose_text_enhanced(text, language):
-    """增強的內容拆解"""
-    sentences = [s.strip() for s in text.split("。") if s.strip()]
-    title = sentences[0][:30] + "..." if len(sentences[0]) > 30 else sentences[0]
-    
-    # 智能分析文案目的
-    purpose_keywords = {
-        "推廣": ["推廣", "宣傳", "廣告", "行銷", "銷售"],
-        "教育": ["教學", "學習", "課程", "培訓", "教育"],
-        "資訊": ["資訊", "消息", "公告", "通知", "報告"],
-        "娛樂": ["娛樂", "有趣", "好玩", "精彩", "刺激"],
-        "服務": ["服務", "幫助", "支援", "協助", "諮詢"]
-    }
-    
-    detected_purpose = "資訊傳達"
-    for purpose, keywords in purpose_keywords.items():
-        if any(keyword in text for keyword in keywords):
-            detected_purpose = purpose
-            break
-    
-    # 智能分析目標受眾
-    audience_keywords = {
-        "年輕人": ["年輕人", "學生", "青年", "青少年"],
-        "上班族": ["上班族", "職場", "工作", "專業"],
-        "家長": ["家長", "父母", "家庭", "孩子"],
-        "企業": ["企業", "公司", "商業", "B2B"],
-        "一般大眾": ["大眾", "所有人", "大家", "各位"]
-    }
-    
-    detected_audience = "一般讀者"
-    for audience, keywords in audience_keywords.items():
-        if any(keyword in text for keyword in keywords):
-            detected_audience = audience
-            break
-    
-    decomposition = {
-        "title_suggestion": title,
-        "audience": detected_audience,
-        "purpose": detected_purpose,
-        "tone": "專業、友善",
-        "length": "200-300字",
-        "key_points": sentences[:5],
-        "facts_or_constraints": [],
-        "call_to_action": "了解更多資訊",
-        "language": language,
-        "confidence": 0.8
-    }
-    
-    return decomposition
+# 單一批量任務的文字數量上限（需大於 BATCH_SHARD_THRESHOLD，大型任務才會用到多進程分片）
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "50000"))
+if MAX_BATCH_SIZE < BATCH_SHARD_THRESHOLD:
+    print(f"⚠️ MAX_BATCH_SIZE（{MAX_BATCH_SIZE}）小於 BATCH_SHARD_THRESHOLD（{BATCH_SHARD_THRESHOLD}），自動分片不會啟用")
 
-def generate_content_enhanced(decomposition, style, form, length, language="中文"):
-    """增強的文案生成"""
-    
-    # 獲取風格和形式的詳細資訊
-    style_info = ENHANCED_STYLES.get(style, {})
-    form_info = ENHANCED_FORMS.get(form, {})
-    
-    # 多語言模板
-    templates = {
-        "中文": {
-            "活潑": {
-                "社群貼文": "🎉 超棒的{title}來啦！{key_points} 快來看看吧！",
-                "Email標題": "🔥 不容錯過：{title}",
-                "完整文章": "親愛的朋友們！{title} 真的超級棒！{key_points} 相信你一定會喜歡的！"
-            },
-            "專業": {
-                "社群貼文": "專業{title}，{key_points}，值得信賴的選擇。",
-                "Email標題": "專業服務：{title}",
-                "完整文章": "我們很榮幸為您介紹{title}。{key_points} 我們的專業團隊將為您提供最優質的服務。"
-            }
-        },
-        "英文": {
-            "活潑": {
-                "社群貼文": "🎉 Amazing {title} is here! {key_points} Check it out!",
-                "Email標題": "🔥 Don't miss: {title}",
-                "完整文章": "Hey everyone! {title} is absolutely fantastic! {key_points} You're going to love it!"
-            },
-            "專業": {
-                "社群貼文": "Professional {title}, {key_points}, a choice you can trust.",
-                "Email標題": "Professional Service: {title}",
-                "完整文章": "We are honored to introduce {title}. {key_points} Our professional team will provide you with the highest quality service."
-            }
-        }
-    }
-    
-    # 選擇模板
-    lang_templates = templates.get(language, templates["中文"])
-    style_templates = lang_templates.get(style, lang_templates["專業"])
-    template = style_templates.get(form, "這是關於{title}的內容。{key_points}")
-    
-    # 填充內容
-    key_points_text = "、".join(decomposition['key_points'][:3])
-    generated_text = template.format(
-        title=decomposition['title_suggestion'],
-        key_points=key_points_text
+# 串流連線在沒有新結果時送出 keep-alive 的間隔（秒）
+BATCH_STREAM_KEEPALIVE = float(os.environ.get("BATCH_STREAM_KEEPALIVE", "15"))
+# 串流連線重新檢查任務儲存的間隔（秒），涵蓋由其他工作進程寫入的任務
+BATCH_STREAM_POLL_INTERVAL = float(os.environ.get("BATCH_STREAM_POLL_INTERVAL", "1"))
+# 串流連線每次從儲存讀取的結果數量上限
+BATCH_STREAM_PAGE_SIZE = 500
+
+def analyze_text(text, language="自動檢測", cleaned_text=None, detection=None):
+    """
+    清理文字、檢測語言並拆解內容
+    結果以原始文字與指定語言的雜湊快取，重複送出相同文字時直接返回
+    批量處理時可傳入已清理的文字（cleaned_text）與已檢測的語言（detection），省去逐筆處理
+    """
+    return cached_analysis(decompose_cache, text, language, cleaned_text, detection)
+
+def generate_content_cached(decomposition, style, form, length, language="中文", fresh=False):
+    """生成文案（開啟快取時相同參數返回上次的結果；模板的結果與 seed 無關，快取鍵不含 seed）"""
+    return cached_generation(generation_cache, decomposition, style, form, length, language, fresh)
+
+def _process_batch_item(index, text, style, form, length, language, cleaned_text=None, detection=None):
+    """處理批量任務中的單一文字（使用本進程的拆解與生成快取）"""
+    return process_batch_item(
+        index, text, style, form, length, language, cleaned_text, detection,
+        analyze=analyze_text, generate=generate_content_cached
     )
-    
-    # 根據長度調整
-    max_length = form_info.get("max_length", 300)
-    if length == "短":
-        generated_text = generated_text[:max_length//3] + "..."
-    elif length == "中":
-        generated_text = generated_text[:max_length//2]
-    elif length == "長":
-        generated_text = generated_text[:max_length]
-    
-    # 添加標籤（如果支援）
-    if form_info.get("hashtag_support", False):
-        hashtags = f"\n\n#{style}#{form}#{language}"
-        generated_text += hashtags
-    
-    return generated_text
 
-def create_batch_job(texts, styles, forms, lengths, languages):
-    """創建批量處理任務"""
+def _append_batch_results(job_id, results):
+    """將一批結果寫回任務並更新進度"""
+    completed = sum(1 for result in results if "error" not in result)
+    batch_jobs.append_results(job_id, results, completed)
+    batch_updates.notify(job_id)
+
+def _update_batch_job(job_id, **fields):
+    """更新任務狀態並通知串流連線"""
+    batch_jobs.update(job_id, **fields)
+    batch_updates.notify(job_id)
+
+def _run_batch_job(job_id, items, mode):
+    """在背景工作執行緒中處理批量任務，逐筆更新進度"""
+    _update_batch_job(job_id, status="processing")
+
+    try:
+        if mode == "process":
+            # 分塊分派到進程池，結果依索引順序合併
+            batch_process_pool.map_chunks(
+                process_batch_chunk,
+                items,
+                lambda results: _append_batch_results(job_id, results)
+            )
+        else:
+            cleaned_texts, detections = prepare_batch_texts(items)
+            for i, item in enumerate(items):
+                result = _process_batch_item(
+                    i, *item, cleaned_text=cleaned_texts[i], detection=detections[i]
+                )
+                _append_batch_results(job_id, [result])
+    except Exception as e:
+        _update_batch_job(job_id, status="failed", error=str(e))
+        return
+
+    _update_batch_job(job_id, status="completed")
+
+def create_batch_job(texts, styles, forms, lengths, languages, mode="auto"):
+    """
+    創建批量處理任務，交由背景執行器處理後立即返回
+    mode: thread（單執行緒逐筆處理）、process（多進程分片）、auto（依數量自動選擇）
+    """
     job_id = str(uuid.uuid4())
-    
-    batch_jobs[job_id] = {
+
+    if mode not in ("thread", "process"):
+        use_processes = len(texts) >= BATCH_SHARD_THRESHOLD and BATCH_PROCESS_WORKERS > 1
+        mode = "process" if use_processes else "thread"
+
+    # 補齊每個文字的參數
+    items = [
+        (
+            text,
+            styles[i] if i < len(styles) else "專業",
+            forms[i] if i < len(forms) else "完整文章",
+            lengths[i] if i < len(lengths) else "中",
+            languages[i] if i < len(languages) else "中文"
+        )
+        for i, text in enumerate(texts)
+    ]
+
+    batch_jobs.create({
         "id": job_id,
-        "status": "processing",
+        "status": "queued",
+        "mode": mode,
         "total": len(texts),
         "completed": 0,
-        "results": [],
         "created_at": datetime.now().isoformat()
-    }
-    
-    # 模擬批量處理
-    for i, text in enumerate(texts):
-        try:
-            # 處理每個文字
-            decomposition = decompose_text_enhanced(text, languages[i] if i < len(languages) else "中文")
-            generated_text = generate_content_enhanced(
-                decomposition, 
-                styles[i] if i < len(styles) else "專業",
-                forms[i] if i < len(forms) else "完整文章",
-                lengths[i] if i < len(lengths) else "中",
-                languages[i] if i < len(languages) else "中文"
-            )
-            
-            batch_jobs[job_id]["results"].append({
-                "index": i,
-                "original_text": text,
-                "decomposition": decomposition,
-                "generated_text": generated_text,
-                "style": styles[i] if i < len(styles) else "專業",
-                "form": forms[i] if i < len(forms) else "完整文章",
-                "length": lengths[i] if i < len(lengths) else "中",
-                "language": languages[i] if i < len(languages) else "中文"
-            })
-            
-            batch_jobs[job_id]["completed"] += 1
-            
-        except Exception as e:
-            batch_jobs[job_id]["results"].append({
-                "index": i,
-                "error": str(e)
-            })
-    
-    batch_jobs[job_id]["status"] = "completed"
+    })
+
+    try:
+        batch_executor.submit(_run_batch_job, job_id, items, mode)
+    except queue.Full:
+        batch_jobs.delete(job_id)
+        raise
+
     return job_id
 
 @app.route("/")
@@ -338,6 +210,15 @@ def get_forms():
     """獲取支援的文案形式"""
     return jsonify(ENHANCED_FORMS)
 
+@app.route("/api/cache/stats")
+def get_cache_stats():
+    """獲取快取命中統計"""
+    return jsonify({
+        "decompose": decompose_cache.stats(),
+        "decompositions": decompositions.stats(),
+        "generation": generation_cache.stats()
+    })
+
 @app.route("/decompose", methods=["POST"])
 def decompose():
     """Step 1: 拆解原始文字"""
@@ -347,24 +228,8 @@ def decompose():
     if not text.strip():
         return jsonify({"error": "請輸入文字"}), 400
     
-    # 清理文字
-    cleaned_text = clean_text(text)
-    
-    # 檢測語言
-    if language == "自動檢測":
-        detected_lang, confidence = detect_language_enhanced(cleaned_text)
-    else:
-        detected_lang, confidence = language, 1.0
-    
-    # 拆解內容
-    decomposition = decompose_text_enhanced(cleaned_text, detected_lang)
-    
-    return jsonify({
-        "decomposition": decomposition,
-        "detected_language": detected_lang,
-        "confidence": confidence,
-        "cleaned_text": cleaned_text
-    })
+    # 清理、檢測語言並拆解（相同文字直接使用快取）
+    return jsonify(analyze_text(text, language))
 
 @app.route("/confirm", methods=["POST"])
 def confirm():
@@ -379,13 +244,13 @@ def confirm():
         "decomposition": decomposition
     }
     
-    # 儲存到檔案
-    with open(f"confirmed_{confirmed_id}.json", "w", encoding="utf-8") as f:
-        json.dump(confirmed_data, f, ensure_ascii=False, indent=2)
+    # 儲存到拆解內容儲存（SQLite + LRU 快取）
+    decompositions.save(confirmed_data)
     
     return jsonify({"confirmed_id": confirmed_id})
 
 @app.route("/generate", methods=["POST"])
+@generate_limiter.limit
 def generate():
     """Step 3: 生成新文案"""
     confirmed_id = request.json.get("confirmed_id")
@@ -393,18 +258,25 @@ def generate():
     form = request.json.get("form", "完整文章")
     length = request.json.get("length", "中")
     language = request.json.get("language", "中文")
+    fresh = bool(request.json.get("fresh", False))
+    try:
+        parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    return generate_version(confirmed_id, style, form, length, language, fresh)
+
+def generate_version(confirmed_id, style, form, length, language, fresh=False):
+    """生成文案並儲存版本紀錄"""
     # 讀取確認的拆解內容
-    try:
-        with open(f"confirmed_{confirmed_id}.json", "r", encoding="utf-8") as f:
-            confirmed_data = json.load(f)
-    except FileNotFoundError:
+    confirmed_data = decompositions.get(confirmed_id)
+    if confirmed_data is None:
         return jsonify({"error": "找不到確認的拆解內容"}), 404
     
     decomposition = confirmed_data["decomposition"]
     
     # 生成新文案
-    generated_text = generate_content_enhanced(decomposition, style, form, length, language)
+    generated_text = generate_content_cached(decomposition, style, form, length, language, fresh)
     
     # 儲存版本紀錄
     version_id = str(uuid.uuid4())
@@ -419,7 +291,7 @@ def generate():
         "generated_text": generated_text
     }
     
-    versions[version_id] = version_data
+    versions.add(version_data)
     
     return jsonify({
         "version_id": version_id,
@@ -434,6 +306,7 @@ def generate():
     })
 
 @app.route("/batch", methods=["POST"])
+@batch_limiter.limit
 def batch_generate():
     """批量生成文案"""
     data = request.json
@@ -442,45 +315,146 @@ def batch_generate():
     forms = data.get("forms", ["完整文章"] * len(texts))
     lengths = data.get("lengths", ["中"] * len(texts))
     languages = data.get("languages", ["中文"] * len(texts))
+    mode = data.get("mode", "auto")
     
     if not texts:
         return jsonify({"error": "請提供要處理的文字"}), 400
     
-    # 創建批量任務
-    job_id = create_batch_job(texts, styles, forms, lengths, languages)
+    if len(texts) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"批量處理數量超過上限（{MAX_BATCH_SIZE}）"}), 413
+    
+    # 創建批量任務（交由背景執行器處理；佇列已滿時返回 429，Retry-After 依執行器積壓估算）
+    try:
+        job_id = create_batch_job(texts, styles, forms, lengths, languages, mode)
+    except queue.Full:
+        raise batch_limiter.reject(batch_executor.backlog_seconds())
     
     return jsonify({
         "job_id": job_id,
-        "status": "processing",
+        "status": batch_jobs.get(job_id, include_results=False)["status"],
         "total": len(texts)
     })
 
 @app.route("/batch/<job_id>")
 def get_batch_status(job_id):
     """獲取批量任務狀態"""
-    if job_id not in batch_jobs:
+    job = batch_jobs.get(job_id)
+    if job is None:
         return jsonify({"error": "任務不存在"}), 404
     
-    return jsonify(batch_jobs[job_id])
+    return jsonify(job)
 
-@app.route("/batch/<job_id>/download")
-def download_batch_results(job_id):
-    """下載批量處理結果"""
+def _format_stream_event(fmt, event, data, event_id=None):
+    """將事件格式化為 SSE 或 NDJSON"""
+    if fmt == "ndjson":
+        return json.dumps({"event": event, "id": event_id, "data": data}, ensure_ascii=False) + "\n"
+    
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+@app.route("/batch/<job_id>/stream")
+def stream_batch_results(job_id):
+    """以 Server-Sent Events（或 NDJSON）即時推送批量任務結果"""
     if job_id not in batch_jobs:
         return jsonify({"error": "任務不存在"}), 404
     
-    job = batch_jobs[job_id]
-    if job["status"] != "completed":
-        return jsonify({"error": "任務尚未完成"}), 400
+    fmt = request.args.get("format", "sse")
     
-    # 創建 ZIP 文件
-    memory_file = BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+    # 斷線重連時從上次收到的結果之後繼續
+    try:
+        last_event_id = request.headers.get("Last-Event-ID")
+        if last_event_id is not None:
+            start = int(last_event_id) + 1
+        else:
+            start = int(request.args.get("from", 0))
+    except ValueError:
+        return jsonify({"error": "無效的起始索引"}), 400
+    
+    def events():
+        batch_updates.subscribe(job_id)
+        try:
+            yield from stream_events()
+        finally:
+            batch_updates.unsubscribe(job_id)
+    
+    def stream_events():
+        next_index = max(0, start)
+        last_status = None
+        last_sent = time.monotonic()
+        
+        while True:
+            # 在鎖外讀取儲存；沒有新結果時才等待此任務的下一次通知（或輪詢間隔，涵蓋其他工作進程的寫入）
+            version = batch_updates.version(job_id)
+            job = batch_jobs.get(job_id, include_results=False)
+            if job is None:
+                return
+            results = batch_jobs.get_results(job_id, next_index, BATCH_STREAM_PAGE_SIZE)
+            if not results and job["status"] not in FINISHED_STATUSES:
+                batch_updates.wait(job_id, version, BATCH_STREAM_POLL_INTERVAL)
+                job = batch_jobs.get(job_id, include_results=False)
+                if job is None:
+                    return
+                results = batch_jobs.get_results(job_id, next_index, BATCH_STREAM_PAGE_SIZE)
+            
+            status = job["status"]
+            progress = {
+                "status": status,
+                "completed": job["completed"],
+                "received": next_index + len(results),
+                "total": job["total"]
+            }
+            
+            for result in results:
+                yield _format_stream_event(fmt, "result", result, next_index)
+                next_index += 1
+            
+            if results or status != last_status:
+                yield _format_stream_event(fmt, "progress", progress)
+                last_status = status
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= BATCH_STREAM_KEEPALIVE:
+                # 以實際經過的時間計算，不受提前結束的等待影響
+                last_sent = time.monotonic()
+                if fmt == "ndjson":
+                    yield _format_stream_event(fmt, "progress", progress)
+                else:
+                    yield ": keep-alive\n\n"
+            
+            # 任務已結束且結果已全部送出
+            if status in FINISHED_STATUSES and len(results) < BATCH_STREAM_PAGE_SIZE:
+                yield _format_stream_event(fmt, "done", progress)
+                return
+    
+    mimetype = "application/x-ndjson" if fmt == "ndjson" else "text/event-stream"
+    return Response(
+        events(),
+        mimetype=mimetype,
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+# ZIP 壓縮方式
+ZIP_COMPRESSION = {
+    "deflated": zipfile.ZIP_DEFLATED,
+    "stored": zipfile.ZIP_STORED
+}
+
+def _iter_batch_zip(results, compression, compresslevel):
+    """逐個檔案產生 ZIP 內容，記憶體用量不隨批量大小增加"""
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression, compresslevel=compresslevel) as zf:
         # 添加結果文件
-        for i, result in enumerate(job["results"]):
-            if "error" not in result:
-                filename = f"文案_{i+1}_{result['style']}_{result['form']}.txt"
-                content = f"""文案內容：
+        for i, result in enumerate(results):
+            if "error" in result:
+                continue
+            filename = f"文案_{i+1}_{result['style']}_{result['form']}.txt"
+            content = f"""文案內容：
 {result['generated_text']}
 
 生成參數：
@@ -490,46 +464,39 @@ def download_batch_results(job_id):
 語言：{result['language']}
 生成時間：{datetime.now().isoformat()}
 """
-                zf.writestr(filename, content.encode('utf-8'))
+            zf.writestr(filename, content.encode('utf-8'))
+            yield buffer.drain()
     
-    memory_file.seek(0)
-    
-    return send_file(
-        memory_file,
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=f"批量文案_{job_id[:8]}.zip"
-    )
+    # 中央目錄
+    yield buffer.drain()
 
-@app.route("/versions/<confirmed_id>")
-def get_versions(confirmed_id):
-    """獲取特定拆解內容的所有版本"""
-    user_versions = [v for v in versions.values() if v["confirmed_id"] == confirmed_id]
-    return jsonify(user_versions)
-
-@app.route("/download/<version_id>")
-def download_version(version_id):
-    """下載特定版本的文案"""
-    if version_id not in versions:
-        return jsonify({"error": "版本不存在"}), 404
+@app.route("/batch/<job_id>/download")
+def download_batch_results(job_id):
+    """下載批量處理結果（以串流方式輸出 ZIP）"""
+    job = batch_jobs.get(job_id, include_results=False)
+    if job is None:
+        return jsonify({"error": "任務不存在"}), 404
     
-    version = versions[version_id]
-    filename = f"文案_{version['style']}_{version['form']}_{version['timestamp'][:10]}.txt"
+    if job["status"] != "completed":
+        return jsonify({"error": "任務尚未完成"}), 400
     
-    # 創建臨時檔案
-    temp_file = f"temp_{filename}"
-    with open(temp_file, "w", encoding="utf-8") as f:
-        f.write(f"文案內容：\n{version['generated_text']}\n\n")
-        f.write(f"生成參數：\n")
-        f.write(f"風格：{version['style']}\n")
-        f.write(f"形式：{version['form']}\n")
-        f.write(f"長度：{version['length']}\n")
-        f.write(f"語言：{version['language']}\n")
-        f.write(f"生成時間：{version['timestamp']}\n")
+    # 壓縮選項：?compression=deflated|stored&level=0-9
+    compression = ZIP_COMPRESSION.get(request.args.get("compression", "deflated"))
+    if compression is None:
+        return jsonify({"error": "不支援的壓縮方式"}), 400
     
-    return send_file(temp_file, as_attachment=True, download_name=filename)
+    compresslevel = request.args.get("level", type=int)
+    if compresslevel is not None and not 0 <= compresslevel <= 9:
+        return jsonify({"error": "壓縮等級需介於 0 到 9"}), 400
+    
+    return Response(
+        _iter_batch_zip(batch_jobs.iter_results(job_id), compression, compresslevel),
+        mimetype='application/zip',
+        headers=attachment_headers(f"批量文案_{job_id[:8]}.zip")
+    )
 
 @app.route("/regenerate", methods=["POST"])
+@generate_limiter.limit
 def regenerate():
     """重新生成文案"""
     confirmed_id = request.json.get("confirmed_id")
@@ -537,19 +504,29 @@ def regenerate():
     form = request.json.get("form")
     length = request.json.get("length")
     language = request.json.get("language")
+    try:
+        parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # 如果沒有提供新參數，使用最後一個版本的參數
     if not all([style, form, length, language]):
-        user_versions = [v for v in versions.values() if v["confirmed_id"] == confirmed_id]
-        if user_versions:
-            last_version = max(user_versions, key=lambda x: x["timestamp"])
+        last_version = versions.latest(confirmed_id)
+        if last_version:
             style = style or last_version["style"]
             form = form or last_version["form"]
             length = length or last_version["length"]
             language = language or last_version.get("language", "中文")
     
-    # 調用生成函數
-    return generate()
+    # 以補齊後的參數生成
+    return generate_version(
+        confirmed_id,
+        style or "專業",
+        form or "完整文章",
+        length or "中",
+        language or "中文",
+        bool(request.json.get("fresh", False))
+    )
 
 if __name__ == "__main__":
     print("🚀 啟動 AI 文案生成工具（增強版本）...")
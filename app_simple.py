@@ -4,26 +4,40 @@
 AI 文案生成工具 - 簡化版本（不依賴 Transformers）
 """
 
-from flask import Flask, render_template, request, jsonify, send_file
-import json
+from flask import Flask, render_template, request, jsonify
 import os
-import re
 from datetime import datetime
 import uuid
 import random
 
+from version_store import VersionRepository
+from text_utils import clean_text
+from generation_cache import parse_seed
+from app_common import (
+    create_common_blueprint, create_decomposition_store, create_generation_cache,
+    create_generate_limiter, create_legacy_file_sweeper
+)
+from simple_content import generate_content_simple
+
 app = Flask(__name__)
 
-# 儲存版本紀錄
-versions = {}
+# 儲存版本紀錄（以 confirmed_id 建立索引）
+versions = VersionRepository()
+
+# 確認後的拆解內容（SQLite + LRU 快取）與舊版檔案清理（第一個請求時才啟動），設定見 app_common.py
+decompositions = create_decomposition_store()
+legacy_file_sweeper = create_legacy_file_sweeper(decompositions)
+
+# 生成結果快取（預設關閉）：相同拆解內容與參數直接返回上次的結果，請求帶 fresh 時重新生成
+generation_cache = create_generation_cache()
 
-def clean_text(text):
-    """清理文字，去除多餘空格和亂碼"""
-    # 去除多餘空格
-    text = re.sub(r'\s+', ' ', text)
-    # 去除特殊字符
-    text = re.sub(r'[^\w\s\u4e00-\u9fff。，！？；：""''（）【】]', '', text)
-    return text.strip()
+# 准入控制：名額與佇列都滿時返回 429 + Retry-After（設定見 app_common.py）
+generate_limiter = create_generate_limiter()
+
+# 版本查詢／下載／匯出、429 處理與准入控制狀態
+app.register_blueprint(create_common_blueprint(
+    versions, lambda: {"generate": generate_limiter.stats()}, (legacy_file_sweeper,)
+))
 
 def detect_language(text):
     """簡單的語言檢測"""
@@ -55,49 +69,13 @@ def decompose_text(text):
     
     return decomposition
 
-def generate_content_simple(decomposition, style, form, length):
-    """使用簡單規則生成文案"""
-    
-    # 文案模板
-    templates = {
-        "活潑": {
-            "社群貼文": "🎉 超棒的{title}來啦！{key_points} 快來看看吧！",
-            "Email標題": "🔥 不容錯過：{title}",
-            "完整文章": "親愛的朋友們！{title} 真的超級棒！{key_points} 相信你一定會喜歡的！"
-        },
-        "專業": {
-            "社群貼文": "專業{title}，{key_points}，值得信賴的選擇。",
-            "Email標題": "專業服務：{title}",
-            "完整文章": "我們很榮幸為您介紹{title}。{key_points} 我們的專業團隊將為您提供最優質的服務。"
-        },
-        "學術": {
-            "社群貼文": "研究發現：{title}，{key_points}，具有重要意義。",
-            "Email標題": "學術研究：{title}",
-            "完整文章": "本研究探討了{title}的相關問題。{key_points} 研究結果顯示了重要的學術價值。"
-        },
-        "幽默": {
-            "社群貼文": "😂 聽說{title}超厲害！{key_points} 要不要來試試看？",
-            "Email標題": "😄 有趣的消息：{title}",
-            "完整文章": "哈哈，今天要跟大家分享一個有趣的話題：{title}！{key_points} 保證讓你笑到肚子痛！"
-        }
-    }
-    
-    # 選擇模板
-    template = templates.get(style, {}).get(form, "這是關於{title}的內容。{key_points}")
-    
-    # 填充內容
-    key_points_text = "、".join(decomposition['key_points'][:3])
-    generated_text = template.format(
-        title=decomposition['title_suggestion'],
-        key_points=key_points_text
-    )
-    
-    # 根據長度調整
-    if length == "短":
-        generated_text = generated_text[:100] + "..."
-    elif length == "長":
-        generated_text = generated_text + " 更多詳細內容請關注我們的更新。"
-    
+def generate_content_cached(decomposition, style, form, length, fresh=False):
+    """生成文案（開啟快取時相同參數返回上次的結果；模板的結果與 seed 無關，快取鍵不含 seed）"""
+    cache_key = generation_cache.make_key(decomposition, style, form, length)
+    generated_text = generation_cache.get(cache_key, bypass=fresh)
+    if generated_text is None:
+        generated_text = generate_content_simple(decomposition, style, form, length)
+        generation_cache.set(cache_key, generated_text)
     return generated_text
 
 @app.route("/")
@@ -141,31 +119,38 @@ def confirm():
         "decomposition": decomposition
     }
     
-    # 儲存到檔案（實際應用中可以使用資料庫）
-    with open(f"confirmed_{confirmed_id}.json", "w", encoding="utf-8") as f:
-        json.dump(confirmed_data, f, ensure_ascii=False, indent=2)
+    # 儲存到拆解內容儲存（SQLite + LRU 快取）
+    decompositions.save(confirmed_data)
     
     return jsonify({"confirmed_id": confirmed_id})
 
 @app.route("/generate", methods=["POST"])
+@generate_limiter.limit
 def generate():
     """Step 3: 生成新文案"""
     confirmed_id = request.json.get("confirmed_id")
     style = request.json.get("style", "專業")
     form = request.json.get("form", "完整文章")
     length = request.json.get("length", "中")
+    fresh = bool(request.json.get("fresh", False))
+    try:
+        parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
+    return generate_version(confirmed_id, style, form, length, fresh)
+
+def generate_version(confirmed_id, style, form, length, fresh=False):
+    """生成文案並儲存版本紀錄"""
     # 讀取確認的拆解內容
-    try:
-        with open(f"confirmed_{confirmed_id}.json", "r", encoding="utf-8") as f:
-            confirmed_data = json.load(f)
-    except FileNotFoundError:
+    confirmed_data = decompositions.get(confirmed_id)
+    if confirmed_data is None:
         return jsonify({"error": "找不到確認的拆解內容"}), 404
     
     decomposition = confirmed_data["decomposition"]
     
     # 生成新文案
-    generated_text = generate_content_simple(decomposition, style, form, length)
+    generated_text = generate_content_cached(decomposition, style, form, length, fresh)
     
     # 儲存版本紀錄
     version_id = str(uuid.uuid4())
@@ -179,7 +164,7 @@ def generate():
         "generated_text": generated_text
     }
     
-    versions[version_id] = version_data
+    versions.add(version_data)
     
     return jsonify({
         "version_id": version_id,
@@ -192,52 +177,35 @@ def generate():
         }
     })
 
-@app.route("/versions/<confirmed_id>")
-def get_versions(confirmed_id):
-    """獲取特定拆解內容的所有版本"""
-    user_versions = [v for v in versions.values() if v["confirmed_id"] == confirmed_id]
-    return jsonify(user_versions)
-
-@app.route("/download/<version_id>")
-def download_version(version_id):
-    """下載特定版本的文案"""
-    if version_id not in versions:
-        return jsonify({"error": "版本不存在"}), 404
-    
-    version = versions[version_id]
-    filename = f"文案_{version['style']}_{version['form']}_{version['timestamp'][:10]}.txt"
-    
-    # 創建臨時檔案
-    temp_file = f"temp_{filename}"
-    with open(temp_file, "w", encoding="utf-8") as f:
-        f.write(f"文案內容：\n{version['generated_text']}\n\n")
-        f.write(f"生成參數：\n")
-        f.write(f"風格：{version['style']}\n")
-        f.write(f"形式：{version['form']}\n")
-        f.write(f"長度：{version['length']}\n")
-        f.write(f"生成時間：{version['timestamp']}\n")
-    
-    return send_file(temp_file, as_attachment=True, download_name=filename)
-
 @app.route("/regenerate", methods=["POST"])
+@generate_limiter.limit
 def regenerate():
     """重新生成文案（同參數或改參數）"""
     confirmed_id = request.json.get("confirmed_id")
     style = request.json.get("style")
     form = request.json.get("form")
     length = request.json.get("length")
+    try:
+        parse_seed(request.json.get("seed"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # 如果沒有提供新參數，使用最後一個版本的參數
     if not all([style, form, length]):
-        user_versions = [v for v in versions.values() if v["confirmed_id"] == confirmed_id]
-        if user_versions:
-            last_version = max(user_versions, key=lambda x: x["timestamp"])
+        last_version = versions.latest(confirmed_id)
+        if last_version:
             style = style or last_version["style"]
             form = form or last_version["form"]
             length = length or last_version["length"]
     
-    # 調用生成函數
-    return generate()
+    # 以補齊後的參數生成
+    return generate_version(
+        confirmed_id,
+        style or "專業",
+        form or "完整文章",
+        length or "中",
+        bool(request.json.get("fresh", False))
+    )
 
 if __name__ == "__main__":
     print("🚀 啟動 AI 文案生成工具（簡化版本）...")
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量任務執行器
+以有界佇列 + 固定數量的背景工作執行緒處理批量任務，讓請求可以立即返回
+大型批量任務可再切塊分派到進程池，利用多核心
+"""
+
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+
+class BatchExecutor:
+    """有界的背景任務執行器"""
+
+    def __init__(self, max_workers=4, max_queue_size=100):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        # 任務執行時間的指數移動平均（估算佇列消化時間）
+        self._avg_seconds = None
+
+    def _ensure_started(self):
+        """第一次提交任務時才啟動工作執行緒"""
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.max_workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    name=f"batch-worker-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任務，佇列已滿時拋出 queue.Full"""
+        self._ensure_started()
+        self._queue.put_nowait((fn, args, kwargs))
+
+    def _worker(self):
+        """工作執行緒主迴圈"""
+        while True:
+            fn, args, kwargs = self._queue.get()
+            with self._lock:
+                self._active += 1
+            started = time.perf_counter()
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                # 任務本身應自行記錄錯誤，這裡只避免執行緒中斷
+                traceback.print_exc()
+            finally:
+                seconds = time.perf_counter() - started
+                with self._lock:
+                    self._active -= 1
+                    self._avg_seconds = seconds if self._avg_seconds is None else 0.8 * self._avg_seconds + 0.2 * seconds
+                self._queue.task_done()
+
+    def backlog_seconds(self):
+        """依等待中與執行中的任務數量與平均執行時間，估算消化目前佇列所需的秒數"""
+        with self._lock:
+            if self._avg_seconds is None:
+                return None
+            pending = self._queue.qsize() + self._active
+            return math.ceil(self._avg_seconds * pending / self.max_workers)
+
+    def stats(self):
+        """獲取執行器狀態"""
+        return {
+            "workers": self.max_workers,
+            "active": self._active,
+            "queued": self._queue.qsize(),
+            "max_queue_size": self.max_queue_size,
+            "avg_job_seconds": round(self._avg_seconds, 3) if self._avg_seconds is not None else None
+        }
+
+
+def _default_start_method():
+    """
+    子進程的啟動方式：進程池是在背景工作執行緒中才建立的，此時其他執行緒可能正持有鎖，
+    直接 fork 可能讓子進程繼承已鎖住的鎖而卡死，因此使用 forkserver（不支援時用 spawn）
+    """
+    methods = multiprocessing.get_all_start_methods()
+    return "forkserver" if "forkserver" in methods else "spawn"
+
+
+class ShardedProcessPool:
+    """
+    將大量項目切塊後分派到多個進程處理，繞過 GIL 限制
+    分塊處理函式需定義在 import 時沒有副作用的模組中（子進程以 forkserver/spawn 啟動時會重新載入）
+    """
+
+    def __init__(self, max_workers=None, chunk_size=500, start_method=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.start_method = start_method or _default_start_method()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        """第一次使用時才建立進程池"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method)
+                )
+            return self._executor
+
+    def _discard_executor(self, executor):
+        """子進程異常結束後進程池無法再使用，丟棄後下次使用時重新建立"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def map_chunks(self, fn, items, on_chunk, chunk_size=None):
+        """
+        以 fn(start, chunk) 處理每個分塊，並依索引順序呼叫 on_chunk(results)
+        先完成的分塊會暫存，等前面的分塊完成後再一併回報
+        """
+        chunk_size = max(1, chunk_size or self.chunk_size)
+        executor = self._get_executor()
+
+        futures = {}
+        pending = {}
+        next_start = 0
+        try:
+            for start in range(0, len(items), chunk_size):
+                future = executor.submit(fn, start, items[start:start + chunk_size])
+                futures[future] = start
+
+            for future in as_completed(futures):
+                pending[futures[future]] = future.result()
+                while next_start in pending:
+                    results = pending.pop(next_start)
+                    on_chunk(results)
+                    next_start += chunk_size
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+    def shutdown(self):
+        """關閉進程池"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
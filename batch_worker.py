@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量任務的逐筆與分塊處理
+分塊處理函式會在進程池的子進程中執行；這個模組與其依賴在 import 時不建立資料庫連線、
+執行緒或 Flask 應用，子進程以 forkserver/spawn 啟動時只需載入這裡
+進程池會重複使用同一批子進程，每個子進程保有自己的拆解與生成快取（設定與主進程相同），
+重新送出的大型批量與批量內重複的文字可直接命中
+"""
+
+import hashlib
+import os
+
+from enhanced_content import build_analysis, generate_content_enhanced
+from generation_cache import GenerationCache
+from language_detection import detect_languages
+from lru_cache import LRUCache
+from text_utils import clean_texts
+
+# 分塊處理（子進程）使用的快取
+DECOMPOSE_CACHE_SIZE = int(os.environ.get("DECOMPOSE_CACHE_SIZE", "4096"))
+GENERATION_CACHE = os.environ.get("GENERATION_CACHE", "false").lower() == "true"
+GENERATION_CACHE_SIZE = int(os.environ.get("GENERATION_CACHE_SIZE", "1024"))
+GENERATION_CACHE_TTL = float(os.environ.get("GENERATION_CACHE_TTL", "3600")) or None
+worker_decompose_cache = LRUCache(DECOMPOSE_CACHE_SIZE)
+worker_generation_cache = GenerationCache(GENERATION_CACHE_SIZE, GENERATION_CACHE_TTL, GENERATION_CACHE)
+
+
+def cached_analysis(cache, text, language="自動檢測", cleaned_text=None, detection=None):
+    """以原始文字與指定語言的雜湊快取 build_analysis 的結果"""
+    key = hashlib.sha256(f"{language}\0{text}".encode("utf-8")).hexdigest()
+    analysis = cache.get(key)
+    if analysis is not None:
+        return analysis
+
+    analysis = build_analysis(text, language, cleaned_text, detection)
+    cache.set(key, analysis)
+    return analysis
+
+
+def cached_generation(cache, decomposition, style, form, length, language="中文", fresh=False):
+    """以生成快取包裝 generate_content_enhanced（模板的結果與 seed 無關，快取鍵不含 seed）"""
+    cache_key = cache.make_key(decomposition, style, form, length, language)
+    generated_text = cache.get(cache_key, bypass=fresh)
+    if generated_text is None:
+        generated_text = generate_content_enhanced(decomposition, style, form, length, language)
+        cache.set(cache_key, generated_text)
+    return generated_text
+
+
+def _worker_analysis(text, language, cleaned_text=None, detection=None):
+    return cached_analysis(worker_decompose_cache, text, language, cleaned_text, detection)
+
+
+def _worker_generation(decomposition, style, form, length, language):
+    return cached_generation(worker_generation_cache, decomposition, style, form, length, language)
+
+
+def prepare_batch_texts(items):
+    """
+    整批清理文字，並對需要自動檢測語言的文字一次向量化檢測
+    只有字串參與整批處理；其他型別留給逐筆處理，錯誤只會記錄在該筆結果
+    """
+    text_indexes = [i for i, item in enumerate(items) if isinstance(item[0], str)]
+    cleaned_texts = [None] * len(items)
+    for i, cleaned_text in zip(text_indexes, clean_texts(items[i][0] for i in text_indexes)):
+        cleaned_texts[i] = cleaned_text
+
+    detections = [None] * len(items)
+    auto_indexes = [i for i in text_indexes if items[i][4] == "自動檢測"]
+    auto_detections = detect_languages(cleaned_texts[i] for i in auto_indexes)
+    for i, detection in zip(auto_indexes, auto_detections):
+        detections[i] = detection
+
+    return cleaned_texts, detections
+
+
+def process_batch_item(index, text, style, form, length, language, cleaned_text=None, detection=None,
+                       analyze=build_analysis, generate=generate_content_enhanced):
+    """
+    處理批量任務中的單一文字
+    analyze / generate 可替換成帶快取的版本（執行緒模式使用主進程的快取，分塊處理使用子進程的快取）
+    """
+    try:
+        analysis = analyze(text, language, cleaned_text, detection)
+        decomposition = analysis["decomposition"]
+        language = analysis["detected_language"]
+        generated_text = generate(decomposition, style, form, length, language)
+
+        return {
+            "index": index,
+            "original_text": text,
+            "decomposition": decomposition,
+            "generated_text": generated_text,
+            "style": style,
+            "form": form,
+            "length": length,
+            "language": language
+        }
+    except Exception as e:
+        return {
+            "index": index,
+            "error": str(e)
+        }
+
+
+def process_batch_chunk(start, items):
+    """處理一個分塊（整塊一次清理與檢測語言，並使用子進程的快取），返回依索引排序的結果"""
+    cleaned_texts, detections = prepare_batch_texts(items)
+    return [
+        process_batch_item(
+            start + i, *item, cleaned_text=cleaned_texts[i], detection=detections[i],
+            analyze=_worker_analysis, generate=_worker_generation
+        )
+        for i, item in enumerate(items)
+    ]
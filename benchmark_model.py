@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成模型推論模式基準測試
+比較 fp32 與 int8 動態量化的載入時間、生成延遲與記憶體用量（RSS）
+每個模式在獨立的子程序中執行，記憶體量測互不影響
+
+使用方式：python benchmark_model.py --modes none,int8 --runs 5 --threads 4
+"""
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+from model_backend import ModelBackend, QUANTIZATION_MODES
+
+SAMPLE_PROMPT = """
+    請根據以下拆解內容，生成一段專業嚴謹的風格的完整的文章內容，
+    字數要求：200-300字。
+
+    拆解內容：
+    標題：Python爬蟲課程即將開課
+    目標受眾：初學者
+    目的：推廣活動
+    語調：專業、友善
+    關鍵要點：適合初學者學習, 課程內容豐富, 包含實戰項目
+
+    請生成符合要求的文案：
+    """
+
+
+def current_rss_mb():
+    """目前的常駐記憶體（MB）"""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    """常駐記憶體峰值（MB；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_mode(args):
+    """子程序：載入指定模式的模型並量測"""
+    rss_before = current_rss_mb()
+    backend = ModelBackend(args.model, prefix_cache_size=0, quantization=args.mode, num_threads=args.threads)
+
+    started = time.perf_counter()
+    generator = backend.get()
+    load_seconds = time.perf_counter() - started
+
+    generate_kwargs = {
+        "max_new_tokens": args.max_new_tokens,
+        "min_new_tokens": args.max_new_tokens,
+        "do_sample": False,
+        "return_full_text": False,
+        "pad_token_id": generator.model.config.eos_token_id
+    }
+
+    # 第一次生成包含初始化成本，不計入
+    generator(SAMPLE_PROMPT, **generate_kwargs)
+
+    latencies = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        generator(SAMPLE_PROMPT, **generate_kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    return {
+        "mode": args.mode,
+        "load_seconds": round(load_seconds, 2),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+        "tokens_per_second": round(args.max_new_tokens / (statistics.mean(latencies) / 1000), 1),
+        "model_rss_mb": round(current_rss_mb() - rss_before, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 fp32 與 int8 動態量化的生成延遲與記憶體用量")
+    parser.add_argument("--model", default=os.environ.get("MODEL_NAME", "gpt2"))
+    parser.add_argument("--modes", default=",".join(QUANTIZATION_MODES))
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("MODEL_TORCH_THREADS", "0")))
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args)))
+        return
+
+    print(f"🧪 模型：{args.model}，每個模式 {args.runs} 次，每次 {args.max_new_tokens} 個 token")
+    results = []
+    for mode in args.modes.split(","):
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            "--mode", mode,
+            "--model", args.model,
+            "--runs", str(args.runs),
+            "--max-new-tokens", str(args.max_new_tokens),
+            "--threads", str(args.threads)
+        ]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            error = (completed.stderr.strip().splitlines() or ["未知錯誤"])[-1]
+            print(f"❌ {mode} 執行失敗：{error}")
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    if not results:
+        sys.exit(1)
+
+    print("-" * 86)
+    print(f"{'模式':<6}{'載入(s)':>9}{'平均(ms)':>11}{'p50(ms)':>10}{'p95(ms)':>10}{'token/s':>10}{'模型RSS(MB)':>14}{'峰值RSS(MB)':>14}")
+    for result in results:
+        print(
+            f"{result['mode']:<8}{result['load_seconds']:>9}{result['mean_ms']:>11}{result['p50_ms']:>10}"
+            f"{result['p95_ms']:>10}{result['tokens_per_second']:>10}{result['model_rss_mb']:>14}{result['peak_rss_mb']:>14}"
+        )
+
+    baseline = next((result for result in results if result["mode"] == "none"), None)
+    if baseline:
+        for result in results:
+            if result is not baseline:
+                print(
+                    f"📊 {result['mode']} 相對 fp32：延遲 x{baseline['mean_ms'] / result['mean_ms']:.2f} 加速，"
+                    f"模型記憶體 {result['model_rss_mb'] / max(baseline['model_rss_mb'], 0.1):.0%}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+確認後拆解內容的儲存
+以 SQLite 取代每個 confirmed_id 一個 JSON 檔案，前方以 LRU 快取避免重複讀取
+"""
+
+import json
+import os
+import threading
+
+from lru_cache import LRUCache
+from sqlite_utils import ThreadLocalSQLite
+
+
+class DecompositionStore:
+    """確認後的拆解內容儲存（SQLite + LRU 快取）"""
+
+    def __init__(self, path=None, cache_size=1024, legacy_dir="."):
+        self.path = path
+        self.legacy_dir = legacy_dir
+        self.cache = LRUCache(cache_size)
+        self._db = ThreadLocalSQLite(path) if path else None
+        # 未設定資料庫路徑時只保存在記憶體
+        self._memory = {}
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._db.connect().execute("""
+                CREATE TABLE IF NOT EXISTS confirmed_decompositions (
+                    id TEXT PRIMARY KEY,
+                    timestamp TEXT NOT NULL,
+                    decomposition TEXT NOT NULL
+                )
+            """)
+
+    def save(self, confirmed_data):
+        """儲存確認後的拆解內容（id、timestamp、decomposition）"""
+        if self._db is not None:
+            self._db.connect().execute(
+                "INSERT OR REPLACE INTO confirmed_decompositions (id, timestamp, decomposition) "
+                "VALUES (?, ?, ?)",
+                (
+                    confirmed_data["id"],
+                    confirmed_data["timestamp"],
+                    json.dumps(confirmed_data["decomposition"], ensure_ascii=False, separators=(",", ":"))
+                )
+            )
+        else:
+            with self._lock:
+                self._memory[confirmed_data["id"]] = confirmed_data
+        self.cache.set(confirmed_data["id"], confirmed_data)
+
+    def get(self, confirmed_id):
+        """讀取確認後的拆解內容，不存在時返回 None"""
+        if not confirmed_id:
+            return None
+
+        confirmed_data = self.cache.get(confirmed_id)
+        if confirmed_data is not None:
+            return confirmed_data
+
+        if self._db is not None:
+            row = self._db.connect().execute(
+                "SELECT id, timestamp, decomposition FROM confirmed_decompositions WHERE id = ?",
+                (confirmed_id,)
+            ).fetchone()
+            if row is not None:
+                confirmed_data = {
+                    "id": row["id"],
+                    "timestamp": row["timestamp"],
+                    "decomposition": json.loads(row["decomposition"])
+                }
+        else:
+            with self._lock:
+                confirmed_data = self._memory.get(confirmed_id)
+
+        if confirmed_data is None:
+            confirmed_data = self._load_legacy(confirmed_id)
+            if confirmed_data is None:
+                return None
+            self.save(confirmed_data)
+            return confirmed_data
+
+        self.cache.set(confirmed_id, confirmed_data)
+        return confirmed_data
+
+    def _load_legacy(self, confirmed_id):
+        """讀取舊版的 confirmed_<id>.json 檔案（升級前建立的資料）"""
+        if self.legacy_dir is None:
+            return None
+
+        filename = os.path.join(self.legacy_dir, f"confirmed_{os.path.basename(confirmed_id)}.json")
+        try:
+            with open(filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def import_legacy_file(self, path):
+        """
+        將舊版 confirmed_<id>.json 匯入資料庫，成功時返回 True（檔案可以刪除）
+        只保存在記憶體時返回 False，避免刪除後重啟遺失資料
+        """
+        name = os.path.basename(path)
+        if self._db is None or not (name.startswith("confirmed_") and name.endswith(".json")):
+            return False
+        return self.get(name[len("confirmed_"):-len(".json")]) is not None
+
+    def stats(self):
+        """獲取快取統計資訊"""
+        return self.cache.stats()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+下載相關工具
+三個版本共用的下載標頭、版本文案格式與版本匯出（zip / ndjson / csv），
+下載內容直接在記憶體中產生，不寫入暫存檔
+"""
+
+import csv
+import io
+import json
+import zipfile
+from urllib.parse import quote
+
+
+def attachment_headers(filename):
+    """產生支援中文檔名的下載標頭"""
+    ascii_name = filename.encode("ascii", "ignore").decode("ascii") or "download"
+    return {
+        "Content-Disposition": f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+    }
+
+
+def version_filename(version):
+    """版本文案的下載檔名"""
+    return f"文案_{version['style']}_{version['form']}_{version['timestamp'][:10]}.txt"
+
+
+def format_version_text(version):
+    """版本文案的下載內容（文案與生成參數）"""
+    lines = [
+        f"文案內容：\n{version['generated_text']}\n",
+        "生成參數：",
+        f"風格：{version['style']}",
+        f"形式：{version['form']}",
+        f"長度：{version['length']}"
+    ]
+    if "language" in version:
+        lines.append(f"語言：{version['language']}")
+    lines.append(f"生成時間：{version['timestamp']}")
+    return "\n".join(lines) + "\n"
+
+
+class ZipStreamBuffer:
+    """只能寫入的緩衝區，讓 zipfile 以串流模式輸出，寫入的內容可逐段取出"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """取出目前累積的內容並清空"""
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# 匯出欄位（csv 欄位順序；沒有語言欄位的版本留空）
+EXPORT_FIELDS = ("id", "timestamp", "style", "form", "length", "language", "generated_text")
+
+
+def _iter_versions_zip(versions):
+    """每個版本一個文字檔，檔名加上序號避免相同參數的版本互相覆蓋"""
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, version in enumerate(versions, 1):
+            zf.writestr(f"{i:03d}_{version_filename(version)}", format_version_text(version).encode("utf-8"))
+            yield buffer.drain()
+
+    # 中央目錄
+    yield buffer.drain()
+
+
+def _iter_versions_ndjson(versions):
+    for version in versions:
+        yield json.dumps(version, ensure_ascii=False) + "\n"
+
+
+def _iter_versions_csv(versions):
+    """逐列輸出 csv（開頭加上 BOM，Excel 開啟時中文不會變成亂碼）"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, EXPORT_FIELDS, restval="", extrasaction="ignore")
+    buffer.write("\ufeff")
+    writer.writeheader()
+    for version in versions:
+        writer.writerow(version)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+# 匯出格式 → (產生器, mimetype)
+EXPORT_FORMATS = {
+    "zip": (_iter_versions_zip, "application/zip"),
+    "ndjson": (_iter_versions_ndjson, "application/x-ndjson"),
+    "csv": (_iter_versions_csv, "text/csv")
+}
+
+
+def export_versions(versions, fmt):
+    """以指定格式串流匯出版本紀錄，返回 (內容產生器, mimetype)；不支援的格式返回 None"""
+    if fmt not in EXPORT_FORMATS:
+        return None
+    iter_export, mimetype = EXPORT_FORMATS[fmt]
+    return iter_export(versions), mimetype
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增強版本的內容模型
+支援的語言、風格、形式與模板，以及文字拆解與文案生成
+import 時不建立資料庫連線、執行緒或 Flask 應用，可在批量任務的子進程中安全載入
+"""
+
+import os
+
+from keyword_matcher import KeywordMatcher
+from language_detection import detect_language
+from template_registry import TemplateRegistry
+from text_utils import clean_text
+
+# 支援的語言列表
+SUPPORTED_LANGUAGES = {
+    "中文": "zh",
+    "英文": "en",
+    "日文": "ja",
+    "韓文": "ko",
+    "法文": "fr",
+    "德文": "de",
+    "西班牙文": "es",
+    "葡萄牙文": "pt",
+    "義大利文": "it",
+    "俄文": "ru"
+}
+
+# 擴展的文案風格
+ENHANCED_STYLES = {
+    "活潑": {
+        "description": "適合年輕族群，使用輕鬆活潑的語言",
+        "emoji": "🎉",
+        "tone": "輕鬆、有趣、充滿活力"
+    },
+    "專業": {
+        "description": "適合商業場合，使用正式專業的語言",
+        "emoji": "💼",
+        "tone": "嚴謹、專業、可信賴"
+    },
+    "學術": {
+        "description": "適合研究報告，使用嚴謹學術的語言",
+        "emoji": "📚",
+        "tone": "嚴謹、客觀、學術性"
+    },
+    "幽默": {
+        "description": "適合娛樂場合，使用風趣幽默的語言",
+        "emoji": "😂",
+        "tone": "風趣、幽默、輕鬆"
+    },
+    "溫馨": {
+        "description": "適合情感表達，使用溫暖親切的語言",
+        "emoji": "💝",
+        "tone": "溫暖、親切、關懷"
+    },
+    "激勵": {
+        "description": "適合鼓舞人心，使用激勵性的語言",
+        "emoji": "🔥",
+        "tone": "激勵、鼓舞、正能量"
+    },
+    "神秘": {
+        "description": "適合懸疑內容，使用神秘吸引的語言",
+        "emoji": "🔮",
+        "tone": "神秘、吸引、懸疑"
+    },
+    "優雅": {
+        "description": "適合高端場合，使用優雅精緻的語言",
+        "emoji": "✨",
+        "tone": "優雅、精緻、高端"
+    }
+}
+
+# 擴展的文案形式
+ENHANCED_FORMS = {
+    "社群貼文": {
+        "description": "適合社群媒體的短文案，吸引眼球",
+        "max_length": 200,
+        "hashtag_support": True
+    },
+    "Email標題": {
+        "description": "吸引人的Email標題，提高開信率",
+        "max_length": 100,
+        "hashtag_support": False
+    },
+    "完整文章": {
+        "description": "完整的文章內容，詳細說明",
+        "max_length": 1000,
+        "hashtag_support": False
+    },
+    "廣告文案": {
+        "description": "商業廣告文案，突出賣點",
+        "max_length": 300,
+        "hashtag_support": True
+    },
+    "新聞稿": {
+        "description": "正式的新聞發布稿",
+        "max_length": 500,
+        "hashtag_support": False
+    },
+    "產品描述": {
+        "description": "產品功能與特色描述",
+        "max_length": 400,
+        "hashtag_support": True
+    },
+    "活動宣傳": {
+        "description": "活動推廣與宣傳文案",
+        "max_length": 350,
+        "hashtag_support": True
+    },
+    "品牌故事": {
+        "description": "品牌理念與故事敘述",
+        "max_length": 600,
+        "hashtag_support": False
+    }
+}
+
+# 多語言模板
+CONTENT_TEMPLATES = {
+    "中文": {
+        "活潑": {
+            "社群貼文": "🎉 超棒的{title}來啦！{key_points} 快來看看吧！",
+            "Email標題": "🔥 不容錯過：{title}",
+            "完整文章": "親愛的朋友們！{title} 真的超級棒！{key_points} 相信你一定會喜歡的！"
+        },
+        "專業": {
+            "社群貼文": "專業{title}，{key_points}，值得信賴的選擇。",
+            "Email標題": "專業服務：{title}",
+            "完整文章": "我們很榮幸為您介紹{title}。{key_points} 我們的專業團隊將為您提供最優質的服務。"
+        }
+    },
+    "英文": {
+        "活潑": {
+            "社群貼文": "🎉 Amazing {title} is here! {key_points} Check it out!",
+            "Email標題": "🔥 Don't miss: {title}",
+            "完整文章": "Hey everyone! {title} is absolutely fantastic! {key_points} You're going to love it!"
+        },
+        "專業": {
+            "社群貼文": "Professional {title}, {key_points}, a choice you can trust.",
+            "Email標題": "Professional Service: {title}",
+            "完整文章": "We are honored to introduce {title}. {key_points} Our professional team will provide you with the highest quality service."
+        }
+    }
+}
+
+# 模板註冊表（TEMPLATE_FILE 可指定外部 JSON 模板檔，修改後自動重新載入）
+TEMPLATE_FILE = os.environ.get("TEMPLATE_FILE")
+template_registry = TemplateRegistry(
+    CONTENT_TEMPLATES,
+    default_template="這是關於{title}的內容。{key_points}",
+    fallback_language="中文",
+    fallback_style="專業",
+    languages=SUPPORTED_LANGUAGES,
+    styles=ENHANCED_STYLES,
+    forms=ENHANCED_FORMS,
+    path=TEMPLATE_FILE
+)
+
+# 文案目的關鍵字
+PURPOSE_KEYWORDS = {
+    "推廣": ["推廣", "宣傳", "廣告", "行銷", "銷售"],
+    "教育": ["教學", "學習", "課程", "培訓", "教育"],
+    "資訊": ["資訊", "消息", "公告", "通知", "報告"],
+    "娛樂": ["娛樂", "有趣", "好玩", "精彩", "刺激"],
+    "服務": ["服務", "幫助", "支援", "協助", "諮詢"]
+}
+
+# 目標受眾關鍵字
+AUDIENCE_KEYWORDS = {
+    "年輕人": ["年輕人", "學生", "青年", "青少年"],
+    "上班族": ["上班族", "職場", "工作", "專業"],
+    "家長": ["家長", "父母", "家庭", "孩子"],
+    "企業": ["企業", "公司", "商業", "B2B"],
+    "一般大眾": ["大眾", "所有人", "大家", "各位"]
+}
+
+# 關鍵字比對器（KEYWORD_FILE 可指定外部 JSON 檔擴充關鍵字與權重）
+KEYWORD_FILE = os.environ.get("KEYWORD_FILE")
+purpose_matcher = KeywordMatcher.from_config(PURPOSE_KEYWORDS, KEYWORD_FILE, "purpose")
+audience_matcher = KeywordMatcher.from_config(AUDIENCE_KEYWORDS, KEYWORD_FILE, "audience")
+
+
+def detect_language_enhanced(text):
+    """增強的語言檢測（單次掃描、查表計分，涵蓋所有支援的語言）"""
+    return detect_language(text)
+
+
+def decompose_text_enhanced(text, language):
+    """增強的內容拆解"""
+    sentences = [s.strip() for s in text.split("。") if s.strip()]
+    title = sentences[0][:30] + "..." if len(sentences[0]) > 30 else sentences[0]
+
+    # 智能分析文案目的與目標受眾（單次掃描比對所有關鍵字）
+    detected_purpose = purpose_matcher.classify(text, default="資訊傳達")
+    detected_audience = audience_matcher.classify(text, default="一般讀者")
+
+    decomposition = {
+        "title_suggestion": title,
+        "audience": detected_audience,
+        "purpose": detected_purpose,
+        "tone": "專業、友善",
+        "length": "200-300字",
+        "key_points": sentences[:5],
+        "facts_or_constraints": [],
+        "call_to_action": "了解更多資訊",
+        "language": language,
+        "confidence": 0.8
+    }
+
+    return decomposition
+
+
+def build_analysis(text, language="自動檢測", cleaned_text=None, detection=None):
+    """
+    清理文字、檢測語言並拆解內容（不經過快取）
+    批量處理時可傳入已清理的文字（cleaned_text）與已檢測的語言（detection），省去逐筆處理
+    """
+    # 清理文字
+    if cleaned_text is None:
+        cleaned_text = clean_text(text)
+
+    # 檢測語言
+    if language == "自動檢測":
+        detected_lang, confidence = detection or detect_language_enhanced(cleaned_text)
+    else:
+        detected_lang, confidence = language, 1.0
+
+    # 拆解內容
+    decomposition = decompose_text_enhanced(cleaned_text, detected_lang)
+
+    return {
+        "decomposition": decomposition,
+        "detected_language": detected_lang,
+        "confidence": confidence,
+        "cleaned_text": cleaned_text
+    }
+
+
+def generate_content_enhanced(decomposition, style, form, length, language="中文"):
+    """增強的文案生成"""
+
+    # 獲取風格和形式的詳細資訊
+    style_info = ENHANCED_STYLES.get(style, {})
+    form_info = ENHANCED_FORMS.get(form, {})
+
+    # 選擇模板（註冊表已預先解析回退規則）
+    formatter = template_registry.lookup(language, style, form)
+
+    # 填充內容
+    key_points_text = "、".join(decomposition['key_points'][:3])
+    generated_text = formatter(
+        title=decomposition['title_suggestion'],
+        key_points=key_points_text
+    )
+
+    # 根據長度調整
+    max_length = form_info.get("max_length", 300)
+    if length == "短":
+        generated_text = generated_text[:max_length//3] + "..."
+    elif length == "中":
+        generated_text = generated_text[:max_length//2]
+    elif length == "長":
+        generated_text = generated_text[:max_length]
+
+    # 添加標籤（如果支援）
+    if form_info.get("hashtag_support", False):
+        hashtags = f"\n\n#{style}#{form}#{language}"
+        generated_text += hashtags
+
+    return generated_text
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+舊檔案清理
+背景執行緒定期刪除工作目錄中超過保留時間的舊版檔案
+（舊版下載留下的 temp_文案_*.txt 檔案、已匯入資料庫的 confirmed_*.json）
+"""
+
+import fnmatch
+import os
+import threading
+import time
+
+
+class LegacyFileSweeper:
+    """定期清理符合檔名樣式且超過保留時間的檔案"""
+
+    def __init__(self, directory=".", patterns=("temp_文案_*.txt",), retention=7 * 86400,
+                 interval=3600, before_remove=None):
+        self.directory = directory
+        self.patterns = tuple(patterns)
+        self.retention = retention
+        self.interval = interval
+        # before_remove(path) 返回 False 時保留該檔案
+        self.before_remove = before_remove
+        self._lock = threading.Lock()
+        self._thread = None
+        self.removed = 0
+        self.kept = 0
+        self.last_sweep = None
+
+    def sweep(self):
+        """執行一次清理，返回刪除的檔案數量"""
+        cutoff = time.time() - self.retention
+        removed = 0
+        kept = 0
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return 0
+
+        for entry in entries:
+            if not any(fnmatch.fnmatch(entry.name, pattern) for pattern in self.patterns):
+                continue
+            try:
+                if not entry.is_file() or entry.stat().st_mtime > cutoff:
+                    continue
+                if self.before_remove is not None and not self.before_remove(entry.path):
+                    kept += 1
+                    continue
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                continue
+
+        with self._lock:
+            self.removed += removed
+            self.kept += kept
+            self.last_sweep = time.time()
+        return removed
+
+    def _run(self):
+        while True:
+            self.sweep()
+            time.sleep(self.interval)
+
+    def start(self):
+        """啟動背景清理執行緒（interval 為 0 時不啟動）"""
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="legacy-file-sweeper", daemon=True)
+                self._thread.start()
+
+    def stats(self):
+        """獲取清理統計"""
+        with self._lock:
+            return {
+                "patterns": list(self.patterns),
+                "retention_seconds": self.retention,
+                "removed": self.removed,
+                "kept": self.kept,
+                "last_sweep": self.last_sweep
+            }
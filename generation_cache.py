@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成結果快取
+以（拆解內容雜湊, 風格, 形式, 長度, 語言, seed）為鍵保存生成的文案，依 LRU 與存活時間淘汰
+預設關閉；請求帶 fresh 參數時略過快取重新生成，並以新結果取代舊的快取
+模板引擎的結果與 seed 無關，簡化版本與增強版本的快取鍵不含 seed
+"""
+
+import hashlib
+import json
+
+from lru_cache import LRUCache
+
+
+def decomposition_hash(decomposition):
+    """拆解內容的雜湊值（欄位順序不影響結果）"""
+    payload = json.dumps(decomposition, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_seed(value):
+    """請求中的 seed：未提供時為 None，否則必須是整數（不符時拋出 ValueError）"""
+    if value is None:
+        return None
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError("seed 必須是整數")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("seed 必須是整數")
+
+
+class GenerationCache:
+    """可選擇開啟的生成結果快取"""
+
+    def __init__(self, maxsize=1024, ttl=None, enabled=False):
+        self.enabled = enabled
+        self._cache = LRUCache(maxsize, ttl)
+
+    def make_key(self, decomposition, style, form, length, language=None, seed=None):
+        """快取鍵；未開啟時不計算雜湊，返回 None"""
+        if not self.enabled:
+            return None
+        return (decomposition_hash(decomposition), style, form, length, language, seed)
+
+    def get(self, key, bypass=False):
+        """讀取快取；未開啟或 bypass 時返回 None"""
+        if not self.enabled or bypass:
+            return None
+        return self._cache.get(key)
+
+    def set(self, key, generated_text):
+        if self.enabled:
+            self._cache.set(key, generated_text)
+
+    def stats(self):
+        """獲取快取統計"""
+        stats = self._cache.stats()
+        stats["enabled"] = self.enabled
+        return stats
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生成路由
+依文案形式與長度把生成請求分派到不同的後端（例如模板引擎、小模型、gpt2），
+並統計每個路由的延遲
+"""
+
+import threading
+import time
+from collections import deque
+
+
+def parse_routes(spec):
+    """
+    解析路由設定：以逗號分隔的「形式=後端」或「形式:長度=後端」
+    例如 "Email標題=template,社群貼文:短=small"
+    """
+    routes = {}
+    for entry in (spec or "").split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        target, _, backend = entry.partition("=")
+        form, _, length = target.strip().partition(":")
+        routes[(form.strip(), length.strip() or None)] = backend.strip()
+    return routes
+
+
+class RouteStats:
+    """單一路由的延遲統計（保留最近 window 筆）"""
+
+    def __init__(self, window=1000):
+        self.requests = 0
+        self.errors = 0
+        self._latencies = deque(maxlen=window)
+
+    def add(self, latency_ms):
+        self._latencies.append(latency_ms)
+
+    def snapshot(self):
+        latencies = sorted(self._latencies)
+        if not latencies:
+            return {"requests": self.requests, "errors": self.errors}
+
+        def percentile(ratio):
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * ratio))], 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "mean_ms": round(sum(latencies) / len(latencies), 1),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(latencies[-1], 1)
+        }
+
+
+class GenerationRouter:
+    """依（形式, 長度）選擇生成後端；設定中找不到的組合使用預設後端"""
+
+    def __init__(self, backends, routes=None, default=None):
+        # backends: {名稱: generate(decomposition, style, form, length, **options)}
+        self.backends = dict(backends)
+        self.default = default or next(iter(self.backends))
+        self.routes = {}
+        for (form, length), backend in (routes or {}).items():
+            if backend in self.backends:
+                self.routes[(form, length)] = backend
+            else:
+                target = f"{form}:{length}" if length else form
+                print(f"⚠️ 生成路由 {target} 指定的後端 {backend} 不存在，改用 {self.default}")
+        self._lock = threading.Lock()
+        self._stats = {name: RouteStats() for name in self.backends}
+
+    def route(self, form, length):
+        """依「形式:長度」→「形式」→ 預設後端的順序選擇"""
+        backend = self.routes.get((form, length))
+        if backend is None:
+            backend = self.routes.get((form, None), self.default)
+        return backend
+
+    def record(self, backend, seconds=None):
+        """記錄一次請求的延遲；seconds 為 None 表示失敗"""
+        with self._lock:
+            stats = self._stats[backend]
+            stats.requests += 1
+            if seconds is None:
+                stats.errors += 1
+            else:
+                stats.add(seconds * 1000)
+
+    def generate(self, decomposition, style, form, length, **options):
+        """以路由選出的後端生成，返回 (後端名稱, 文字)；options（例如 seed）原樣傳給後端"""
+        backend = self.route(form, length)
+        started = time.perf_counter()
+        try:
+            text = self.backends[backend](decomposition, style, form, length, **options)
+        except Exception:
+            self.record(backend)
+            raise
+        self.record(backend, time.perf_counter() - started)
+        return backend, text
+
+    def stats(self):
+        """獲取路由設定與每個後端的延遲統計"""
+        with self._lock:
+            return {
+                "default": self.default,
+                "routes": {
+                    f"{form}:{length}" if length else form: backend
+                    for (form, length), backend in self.routes.items()
+                },
+                "backends": {name: stats.snapshot() for name, stats in self._stats.items()}
+            }
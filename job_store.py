@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量任務儲存
+提供記憶體與 SQLite 兩種後端，SQLite 後端前方可加上 LRU 快取保存已結束任務的欄位
+SQLite 後端記錄每個任務所屬的工作進程與其心跳，進程停止後留下的未完成任務會被標記為失敗
+"""
+
+import abc
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from lru_cache import LRUCache
+from sqlite_utils import ThreadLocalSQLite
+
+# 任務結束後不再變動的狀態，這類任務才會放進快取
+FINISHED_STATUSES = ("completed", "failed")
+
+# 任務欄位（結果另外逐筆儲存）
+JOB_FIELDS = ("id", "status", "mode", "total", "completed", "error", "created_at")
+
+# 所屬工作進程停止後，未完成任務的錯誤訊息
+ORPHANED_JOB_ERROR = "處理此任務的工作進程已停止，請重新提交"
+
+
+class JobStore(abc.ABC):
+    """批量任務儲存介面（子類別需實作 create/get/update/append_results/get_results/delete）"""
+
+    @abc.abstractmethod
+    def create(self, job):
+        """新增任務（不含結果）"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, job_id, include_results=True):
+        """讀取任務，不存在時返回 None"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update(self, job_id, **fields):
+        """更新任務欄位，例如 status、error"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def append_results(self, job_id, results, completed=0):
+        """追加一批結果，並將已完成數量加上 completed"""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_results(self, job_id, start=0, limit=None):
+        """讀取從 start 開始的結果"""
+        raise NotImplementedError
+
+    def iter_results(self, job_id, page_size=500):
+        """分頁逐筆讀取所有結果"""
+        start = 0
+        while True:
+            page = self.get_results(job_id, start, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            start += len(page)
+
+    @abc.abstractmethod
+    def delete(self, job_id):
+        """刪除任務與其結果"""
+        raise NotImplementedError
+
+    def heartbeat(self):
+        """更新目前工作進程的心跳（只有可跨進程共用的後端需要）"""
+
+    def fail_orphaned_jobs(self, stale_after):
+        """將所屬工作進程已停止的未完成任務標記為失敗，返回標記的數量"""
+        return 0
+
+    def __contains__(self, job_id):
+        return self.get(job_id, include_results=False) is not None
+
+
+class JobUpdateNotifier:
+    """
+    同一進程內、依任務區分的更新通知
+    讀取者先以 subscribe 登記要等待的任務，記下 version 後在鎖外讀取儲存，再以 wait 等待該任務的下一次更新；
+    寫入者寫完儲存後呼叫 notify(job_id)，只喚醒等待同一任務的讀取者，沒有讀取者的任務不保留任何狀態
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # job_id → [Condition, 版本, 讀取者數量]
+        self._jobs = {}
+
+    def subscribe(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                entry = self._jobs[job_id] = [threading.Condition(self._lock), 0, 0]
+            entry[2] += 1
+
+    def unsubscribe(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is not None:
+                entry[2] -= 1
+                if entry[2] <= 0:
+                    del self._jobs[job_id]
+
+    def version(self, job_id):
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            return entry[1] if entry is not None else 0
+
+    def notify(self, job_id=None):
+        """通知 job_id 有更新；job_id 為 None 時通知所有任務（例如孤立任務被標記為失敗）"""
+        with self._lock:
+            entries = self._jobs.values() if job_id is None else [self._jobs.get(job_id)]
+            for entry in entries:
+                if entry is not None:
+                    entry[1] += 1
+                    entry[0].notify_all()
+
+    def wait(self, job_id, version, timeout=None):
+        """等待 job_id 在 version 之後的更新（需先 subscribe），有更新時返回 True，逾時返回 False"""
+        with self._lock:
+            entry = self._jobs.get(job_id)
+            if entry is None:
+                return False
+            return entry[0].wait_for(lambda: entry[1] != version, timeout)
+
+
+class MemoryJobStore(JobStore):
+    """記憶體後端（重啟後資料消失，適合開發與測試）"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job, results=[])
+
+    def get(self, job_id, include_results=True):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job = dict(job)
+            job["results"] = list(job["results"]) if include_results else []
+            return job
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def append_results(self, job_id, results, completed=0):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["results"].extend(results)
+            job["completed"] += completed
+
+    def get_results(self, job_id, start=0, limit=None):
+        with self._lock:
+            results = self._jobs[job_id]["results"]
+            end = None if limit is None else start + limit
+            return results[start:end]
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+
+class SQLiteJobStore(JobStore):
+    """SQLite 後端（WAL 模式，結果逐筆一列），可由多個工作進程共用"""
+
+    def __init__(self, path, owner=None):
+        self.path = path
+        # 目前工作進程的識別（主機:PID:隨機碼），記錄在每個由此進程建立的任務上
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._db = ThreadLocalSQLite(path)
+        self._init_schema()
+
+    def _connect(self):
+        return self._db.connect()
+
+    def _init_schema(self):
+        conn = self._connect()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS batch_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                mode TEXT,
+                total INTEGER NOT NULL,
+                completed INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS batch_results (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS batch_job_owners (
+                owner TEXT PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            );
+        """)
+        # 舊版資料庫沒有 owner 欄位
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(batch_jobs)")}
+        if "owner" not in columns:
+            conn.execute("ALTER TABLE batch_jobs ADD COLUMN owner TEXT")
+
+    def create(self, job):
+        self.heartbeat()
+        values = [job.get(field) for field in JOB_FIELDS]
+        self._connect().execute(
+            f"INSERT INTO batch_jobs ({', '.join(JOB_FIELDS)}, owner, updated_at) "
+            f"VALUES ({', '.join('?' * len(JOB_FIELDS))}, ?, ?)",
+            values + [self.owner, datetime.now().isoformat()]
+        )
+
+    def get(self, job_id, include_results=True):
+        row = self._connect().execute(
+            f"SELECT {', '.join(JOB_FIELDS)} FROM batch_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        job = {field: row[field] for field in JOB_FIELDS if row[field] is not None}
+        job["results"] = self.get_results(job_id) if include_results else []
+        return job
+
+    def update(self, job_id, **fields):
+        columns = [field for field in fields if field in JOB_FIELDS and field != "id"]
+        if not columns:
+            return
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        self._connect().execute(
+            f"UPDATE batch_jobs SET {assignments}, updated_at = ? WHERE id = ?",
+            [fields[column] for column in columns] + [datetime.now().isoformat(), job_id]
+        )
+
+    def append_results(self, job_id, results, completed=0):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "INSERT OR REPLACE INTO batch_results (job_id, idx, data) VALUES (?, ?, ?)",
+                [
+                    (job_id, result["index"], json.dumps(result, ensure_ascii=False))
+                    for result in results
+                ]
+            )
+            conn.execute(
+                "UPDATE batch_jobs SET completed = completed + ?, updated_at = ? WHERE id = ?",
+                (completed, datetime.now().isoformat(), job_id)
+            )
+
+    def get_results(self, job_id, start=0, limit=None):
+        rows = self._connect().execute(
+            "SELECT data FROM batch_results WHERE job_id = ? AND idx >= ? ORDER BY idx LIMIT ?",
+            (job_id, start, -1 if limit is None else limit)
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
+
+    def delete(self, job_id):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            conn.execute("DELETE FROM batch_results WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM batch_jobs WHERE id = ?", (job_id,))
+
+    def heartbeat(self):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO batch_job_owners (owner, heartbeat_at) VALUES (?, ?)",
+            (self.owner, time.time())
+        )
+
+    def fail_orphaned_jobs(self, stale_after):
+        """未完成任務的所屬進程超過 stale_after 秒沒有心跳（或沒有記錄所屬進程）時標記為失敗"""
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN")
+            cursor = conn.execute(
+                f"""
+                UPDATE batch_jobs SET status = 'failed', error = ?, updated_at = ?
+                WHERE status NOT IN ({', '.join('?' * len(FINISHED_STATUSES))})
+                  AND (owner IS NULL OR owner NOT IN (
+                      SELECT owner FROM batch_job_owners WHERE heartbeat_at >= ? OR owner = ?
+                  ))
+                """,
+                [ORPHANED_JOB_ERROR, datetime.now().isoformat(), *FINISHED_STATUSES, now - stale_after, self.owner]
+            )
+            conn.execute("DELETE FROM batch_job_owners WHERE heartbeat_at < ? AND owner != ?", (now - stale_after, self.owner))
+        return cursor.rowcount
+
+
+class CachedJobStore(JobStore):
+    """
+    在後端前方加上 LRU 快取，只快取已結束（不再變動）任務的欄位
+    結果不放進快取，一律由後端分頁讀取，快取的記憶體用量不隨任務大小增加
+    """
+
+    def __init__(self, backend, maxsize=32):
+        self.backend = backend
+        self.cache = LRUCache(maxsize)
+
+    def create(self, job):
+        self.backend.create(job)
+
+    def get(self, job_id, include_results=True):
+        job = self.cache.get(job_id)
+        if job is None:
+            job = self.backend.get(job_id, include_results=False)
+            if job is None:
+                return None
+            job.pop("results", None)
+            if job["status"] in FINISHED_STATUSES:
+                self.cache.set(job_id, dict(job))
+        job = dict(job)
+        job["results"] = self.backend.get_results(job_id) if include_results else []
+        return job
+
+    def update(self, job_id, **fields):
+        self.cache.pop(job_id)
+        self.backend.update(job_id, **fields)
+
+    def append_results(self, job_id, results, completed=0):
+        self.backend.append_results(job_id, results, completed)
+
+    def get_results(self, job_id, start=0, limit=None):
+        return self.backend.get_results(job_id, start, limit)
+
+    def delete(self, job_id):
+        self.cache.pop(job_id)
+        self.backend.delete(job_id)
+
+    def heartbeat(self):
+        self.backend.heartbeat()
+
+    def fail_orphaned_jobs(self, stale_after):
+        return self.backend.fail_orphaned_jobs(stale_after)
+
+    def stats(self):
+        """獲取快取統計資訊"""
+        return self.cache.stats()
+
+
+def create_job_store(path=None, cache_size=32):
+    """依設定建立任務儲存：有路徑時使用 SQLite + LRU 快取，否則使用記憶體"""
+    if not path:
+        return MemoryJobStore()
+    return CachedJobStore(SQLiteJobStore(path), cache_size)
+
+
+class JobHeartbeat:
+    """背景執行緒定期更新目前工作進程的心跳，並將所屬進程已停止的未完成任務標記為失敗"""
+
+    def __init__(self, store, stale_after=60, on_orphaned=None):
+        self.store = store
+        self.stale_after = stale_after
+        self.on_orphaned = on_orphaned
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def beat(self):
+        """更新一次心跳並清理孤立任務，返回標記為失敗的任務數量"""
+        self.store.heartbeat()
+        orphaned = self.store.fail_orphaned_jobs(self.stale_after)
+        if orphaned and self.on_orphaned is not None:
+            self.on_orphaned()
+        return orphaned
+
+    def _run(self):
+        while True:
+            try:
+                self.beat()
+            except Exception as e:
+                print(f"⚠️ 批量任務心跳失敗：{e}")
+            time.sleep(self.stale_after / 4)
+
+    def start(self):
+        """啟動背景心跳執行緒（重複呼叫不會啟動多個）"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batch-job-heartbeat", daemon=True)
+                self._thread.start()
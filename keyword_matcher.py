@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+關鍵字分類
+以 Aho–Corasick 自動機一次比對所有關鍵字，掃描時間與關鍵字數量無關
+"""
+
+import json
+import os
+from collections import deque
+
+
+class KeywordMatcher:
+    """多模式關鍵字比對器：建立一次，單次掃描文字即可統計各類別的命中次數"""
+
+    def __init__(self, categories, weights=None):
+        # categories: {類別: [關鍵字, ...]}，類別順序即同分時的優先順序
+        self.categories = list(categories)
+        self.weights = dict(weights or {})
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+
+        for index, category in enumerate(self.categories):
+            for keyword in categories[category]:
+                if keyword:
+                    self._add(keyword, index)
+        self._build_failure_links()
+
+    def _add(self, keyword, category_index):
+        """將關鍵字加入字典樹"""
+        state = 0
+        for ch in keyword:
+            next_state = self._goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][ch] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = next_state
+        self._outputs[state].append(category_index)
+
+    def _build_failure_links(self):
+        """以廣度優先建立失敗連結，並合併後綴狀態的輸出"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(ch, 0)
+                self._outputs[next_state] = (
+                    self._outputs[next_state] + self._outputs[self._fail[next_state]]
+                )
+
+    def count(self, text):
+        """單次掃描文字，返回 {類別: 命中次數}（只包含有命中的類別）"""
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+        counts = [0] * len(self.categories)
+
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for category_index in outputs[state]:
+                counts[category_index] += 1
+
+        return {
+            self.categories[index]: hits
+            for index, hits in enumerate(counts) if hits
+        }
+
+    def classify(self, text, default):
+        """返回加權得分最高的類別，沒有命中時返回 default"""
+        counts = self.count(text)
+        if not counts:
+            return default
+        return max(counts, key=lambda category: counts[category] * self.weights.get(category, 1.0))
+
+    @classmethod
+    def from_config(cls, categories, path=None, section=None):
+        """
+        以內建關鍵字建立比對器，並合併設定檔中的關鍵字
+        設定檔格式：{section: {類別: [關鍵字...]}, "weights": {section: {類別: 權重}}}
+        """
+        merged = {category: list(keywords) for category, keywords in categories.items()}
+        weights = {}
+
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            for category, keywords in config.get(section, {}).items():
+                merged.setdefault(category, []).extend(keywords)
+            weights = config.get("weights", {}).get(section, {})
+
+        return cls(merged, weights)
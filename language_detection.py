@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+語言檢測
+以 Unicode 區塊查表，單次掃描統計各文字系統的字元數，涵蓋所有支援的語言
+長文本在結果已明確時提前結束掃描；批量文字可用 NumPy 一次向量化計算
+"""
+
+try:
+    import numpy as np
+except ImportError:  # 未安裝 NumPy 時批量檢測改為逐段處理
+    np = None
+
+# 文字系統類別
+OTHER = 0
+HAN = 1
+KANA = 2
+HANGUL = 3
+CYRILLIC = 4
+LATIN = 5
+
+# 各文字系統的 Unicode 區塊
+SCRIPT_RANGES = (
+    (HAN, 0x3400, 0x4DBF),       # CJK 擴展 A
+    (HAN, 0x4E00, 0x9FFF),       # CJK 統一漢字
+    (HAN, 0xF900, 0xFAFF),       # CJK 相容漢字
+    (KANA, 0x3040, 0x309F),      # 平假名
+    (KANA, 0x30A0, 0x30FF),      # 片假名
+    (KANA, 0x31F0, 0x31FF),      # 片假名擴展
+    (KANA, 0xFF66, 0xFF9F),      # 半形片假名
+    (HANGUL, 0x1100, 0x11FF),    # 諺文字母
+    (HANGUL, 0x3130, 0x318F),    # 諺文相容字母
+    (HANGUL, 0xAC00, 0xD7AF),    # 諺文音節
+    (CYRILLIC, 0x0400, 0x04FF),  # 西里爾字母
+    (LATIN, 0x0041, 0x005A),     # 基本拉丁字母（大寫）
+    (LATIN, 0x0061, 0x007A),     # 基本拉丁字母（小寫）
+    (LATIN, 0x00C0, 0x024F),     # 拉丁字母擴展
+)
+
+# 拉丁語系各語言的特徵字母（用來區分使用拉丁字母的語言）
+# 多個語言共用的字母權重較低（1 / 共用的語言數），只出現在單一語言的字母權重為 1
+LATIN_MARKERS = {
+    "法文": "àâæçéèêëîïôœùûÿ",
+    "德文": "äöüß",
+    "西班牙文": "áéíñóúü¿¡",
+    "葡萄牙文": "ãõáâêôçéíóúà",
+    "義大利文": "àèéìíîòóùú",
+}
+
+# 各語言的計分方式：使用的文字系統
+LANGUAGE_SCRIPTS = {
+    "中文": HAN,
+    "英文": LATIN,
+    "日文": KANA,
+    "韓文": HANGUL,
+    "法文": LATIN,
+    "德文": LATIN,
+    "西班牙文": LATIN,
+    "葡萄牙文": LATIN,
+    "義大利文": LATIN,
+    "俄文": CYRILLIC,
+}
+
+# 加權後的特徵字母佔拉丁字母的比例達到此值才判定為該語言，否則視為英文
+# （英文裡偶爾出現的 café、résumé 等外來字不會讓整段文字被判定為其他語言）
+LATIN_MARKER_MIN_DENSITY = 0.03
+
+# 假名佔漢字+假名的比例達到此值時，漢字也計入日文
+JAPANESE_KANA_RATIO = 0.05
+
+# 提前結束：掃描至少 EARLY_STOP_MIN_CHARS 個字元，且單一文字系統佔比達 EARLY_STOP_RATIO
+EARLY_STOP_MIN_CHARS = 400
+EARLY_STOP_CHECK_INTERVAL = 256
+EARLY_STOP_RATIO = 0.9
+
+
+def _build_tables():
+    """
+    建立 BMP 字元 → 類別的查詢表；拉丁特徵字母各自佔一個類別
+    同時返回每個拉丁語系語言的 [(特徵字母類別, 權重), ...]
+    """
+    table = bytearray(0x10000)
+    for script, start, end in SCRIPT_RANGES:
+        table[start:end + 1] = bytes([script]) * (end - start + 1)
+
+    marker_classes = {}
+    for markers in LATIN_MARKERS.values():
+        for ch in markers + markers.upper():
+            if len(ch) == 1 and ch not in marker_classes:
+                marker_classes[ch] = LATIN + 1 + len(marker_classes)
+                table[ord(ch)] = marker_classes[ch]
+
+    shared = {}
+    for markers in LATIN_MARKERS.values():
+        for ch in set(markers):
+            shared[ch] = shared.get(ch, 0) + 1
+
+    language_markers = {}
+    for language, markers in LATIN_MARKERS.items():
+        weights = {}
+        for ch in markers:
+            for variant in (ch, ch.upper()):
+                if variant in marker_classes:
+                    weights[marker_classes[variant]] = 1 / shared[ch]
+        language_markers[language] = sorted(weights.items())
+    return table, LATIN + 1 + len(marker_classes), language_markers
+
+
+_CLASS_TABLE, _CLASS_COUNT, _LANGUAGE_MARKERS = _build_tables()
+
+
+def _classify(code):
+    """BMP 以外的字元：CJK 擴展 B 之後的漢字視為漢字"""
+    if 0x20000 <= code <= 0x3134F:
+        return HAN
+    return OTHER
+
+
+def _scripts_decided(counts):
+    """判斷目前的統計是否已足以決定語言（拉丁語系需看完全文才能區分）"""
+    latin = sum(counts[LATIN:])
+    classified = counts[HAN] + counts[KANA] + counts[HANGUL] + counts[CYRILLIC] + latin
+    if classified < EARLY_STOP_MIN_CHARS:
+        return False
+
+    if counts[KANA]:
+        # 日文：漢字與假名一起計算
+        return counts[HAN] + counts[KANA] >= classified * EARLY_STOP_RATIO
+    return max(counts[HAN], counts[HANGUL], counts[CYRILLIC]) >= classified * EARLY_STOP_RATIO
+
+
+def script_histogram(text, early_stop=True):
+    """
+    單次掃描統計每個類別的字元數
+    返回 (counts, scanned)，scanned 為實際掃描的字元數
+    """
+    counts = [0] * _CLASS_COUNT
+    table = _CLASS_TABLE
+    next_check = EARLY_STOP_CHECK_INTERVAL if early_stop else -1
+
+    scanned = 0
+    for ch in text:
+        code = ord(ch)
+        counts[table[code] if code < 0x10000 else _classify(code)] += 1
+        scanned += 1
+        if scanned == next_check:
+            if _scripts_decided(counts):
+                break
+            next_check += EARLY_STOP_CHECK_INTERVAL
+
+    return counts, scanned
+
+
+def latin_language(counts):
+    """
+    決定拉丁字母屬於哪個語言：加權特徵字母最多的語言（同分時依 LATIN_MARKERS 順序），
+    密度未達 LATIN_MARKER_MIN_DENSITY 時為英文
+    """
+    latin = sum(counts[LATIN:])
+    best, best_weight = "英文", 0
+    for language, markers in _LANGUAGE_MARKERS.items():
+        weight = sum(counts[cls] * w for cls, w in markers)
+        if weight > best_weight:
+            best, best_weight = language, weight
+    if best_weight < latin * LATIN_MARKER_MIN_DENSITY:
+        return "英文"
+    return best
+
+
+def score_languages(counts):
+    """依文字系統統計計算每個支援語言的分數（拉丁字母全部計入判定出的單一語言）"""
+    han = counts[HAN]
+    kana = counts[KANA]
+    latin = sum(counts[LATIN:])
+    latin_detected = latin_language(counts)
+
+    scores = {}
+    for language, script in LANGUAGE_SCRIPTS.items():
+        if script == LATIN:
+            scores[language] = latin if language == latin_detected else 0
+        elif script == KANA:
+            ja_uses_han = kana and kana >= (han + kana) * JAPANESE_KANA_RATIO
+            scores[language] = kana + (han if ja_uses_han else 0)
+        else:
+            scores[language] = counts[script]
+    return scores
+
+
+def detect_language(text, early_stop=True):
+    """檢測語言，返回 (語言, 置信度)"""
+    counts, scanned = script_histogram(text, early_stop)
+    scores = score_languages(counts)
+
+    # 返回得分最高的語言（同分時依 LANGUAGE_SCRIPTS 順序）
+    detected_lang = max(scores, key=scores.get)
+    confidence = min(1.0, scores[detected_lang] / max(1, scanned))
+
+    return detected_lang, confidence
+
+
+# 批量文字數量達到此值才使用 NumPy 向量化檢測
+BATCH_VECTORIZE_MIN_TEXTS = 16
+
+if np is not None:
+    _NP_CLASS_TABLE = np.frombuffer(bytes(_CLASS_TABLE), dtype=np.uint8)
+
+    # 特徵字母類別 × 拉丁語系語言的權重矩陣
+    _NP_MARKER_WEIGHTS = np.zeros((_CLASS_COUNT, len(_LANGUAGE_MARKERS)))
+    for _column, _markers in enumerate(_LANGUAGE_MARKERS.values()):
+        for _cls, _weight in _markers:
+            _NP_MARKER_WEIGHTS[_cls, _column] = _weight
+
+
+def _detect_languages_numpy(texts):
+    """
+    以 NumPy 向量化檢測多段文字：所有文字編碼成一個 UTF-32 陣列，
+    查表得到每個字元的類別後，以 (文字索引, 類別) 一次 bincount 出每段文字的直方圖
+    """
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.int64, count=len(texts))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+
+    # BMP 查表；BMP 以外只有 CJK 擴展漢字需要計入
+    classes = _NP_CLASS_TABLE[np.minimum(codes, 0xFFFF)]
+    astral = codes > 0xFFFF
+    if astral.any():
+        astral_han = astral & (codes >= 0x20000) & (codes <= 0x3134F)
+        classes = np.where(astral, np.where(astral_han, HAN, OTHER), classes)
+
+    text_ids = np.repeat(np.arange(len(texts)), lengths)
+    counts = np.bincount(
+        text_ids * _CLASS_COUNT + classes,
+        minlength=len(texts) * _CLASS_COUNT
+    ).reshape(len(texts), _CLASS_COUNT)
+
+    # 依 LANGUAGE_SCRIPTS 順序計算每個語言的分數（與 score_languages 相同規則）
+    han = counts[:, HAN]
+    kana = counts[:, KANA]
+    ja_uses_han = (kana > 0) & (kana >= (han + kana) * JAPANESE_KANA_RATIO)
+
+    # 拉丁字母歸屬的語言：加權特徵字母最多者，密度不足時為英文（與 latin_language 相同規則）
+    latin = counts[:, LATIN:].sum(axis=1)
+    marker_weights = counts @ _NP_MARKER_WEIGHTS
+    best_marker = marker_weights.argmax(axis=1)
+    best_weight = marker_weights[np.arange(len(texts)), best_marker]
+    has_markers = (best_weight > 0) & (best_weight >= latin * LATIN_MARKER_MIN_DENSITY)
+    marker_languages = list(_LANGUAGE_MARKERS)
+
+    columns = []
+    for language, script in LANGUAGE_SCRIPTS.items():
+        if language == "英文":
+            columns.append(np.where(has_markers, 0, latin))
+        elif script == LATIN:
+            detected = has_markers & (best_marker == marker_languages.index(language))
+            columns.append(np.where(detected, latin, 0))
+        elif script == KANA:
+            columns.append(kana + np.where(ja_uses_han, han, 0))
+        else:
+            columns.append(counts[:, script])
+    scores = np.stack(columns, axis=1)
+
+    # argmax 同分時取第一個，與 detect_language 一致
+    best = scores.argmax(axis=1)
+    best_scores = scores[np.arange(len(texts)), best]
+    confidences = np.minimum(1.0, best_scores / np.maximum(1, lengths))
+
+    languages = list(LANGUAGE_SCRIPTS)
+    return [
+        (languages[index], float(confidence))
+        for index, confidence in zip(best.tolist(), confidences.tolist())
+    ]
+
+
+def detect_languages(texts):
+    """批量檢測語言，返回與輸入順序相同的 [(語言, 置信度), ...]"""
+    texts = list(texts)
+    if np is None or len(texts) < BATCH_VECTORIZE_MIN_TEXTS:
+        return [detect_language(text, early_stop=False) for text in texts]
+    return _detect_languages_numpy(texts)
@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文字生成模型後端
+模型在第一次使用時才載入（或由背景執行緒預熱），import 本模組不需要載入 transformers
+同時到達的生成請求由 GenerationBatcher 合併成一次批量的 pipeline 呼叫，
+串流生成由 ModelBackend.stream() 逐段返回新產生的文字
+生成參數 stop_on（結尾字串列表）會轉換成 pipeline 的停止條件，讓短形式提前結束生成
+提示詞中固定的前綴（prefix）只計算一次 past_key_values，之後的單筆請求直接沿用
+max_new_tokens 會依提示詞長度縮減，提示詞加上新產生的 token 不超過模型的上下文長度
+生成參數 seed 讓取樣結果可重現：指定 seed 的請求單獨生成，並在生成期間獨佔 torch 的全域亂數狀態
+CPU 推論可選擇 int8 動態量化（quantization="int8"）與 torch 執行緒數
+"""
+
+import contextlib
+import copy
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from lru_cache import LRUCache
+
+
+class ModelNotReady(Exception):
+    """模型尚未載入完成"""
+
+
+class TextStopCriteria:
+    """停止條件：新產生的文字（非空白）以任一結尾字串結束時停止該序列"""
+
+    def __init__(self, tokenizer, stop_on):
+        self.tokenizer = tokenizer
+        self.stop_on = tuple(stop_on)
+        self.start = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        if self.start is None:
+            # 第一次呼叫時已產生一個新 token
+            self.start = input_ids.shape[1] - 1
+        texts = self.tokenizer.batch_decode(input_ids[:, self.start:], skip_special_tokens=True)
+        done = [bool(text.strip()) and text.rstrip(" ").endswith(self.stop_on) for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class CancelledCriteria:
+    """停止條件：cancelled（threading.Event）被設定時停止所有序列，例如串流的消費端已離開"""
+
+    def __init__(self, cancelled):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+        return torch.full((input_ids.shape[0],), self.cancelled.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def pipeline_kwargs(generator, generate_kwargs, cancelled=None):
+    """將生成參數轉換成 pipeline 參數（stop_on、cancelled → stopping_criteria）"""
+    kwargs = dict(generate_kwargs)
+    stop_on = kwargs.pop("stop_on", None)
+    criteria = []
+    if stop_on:
+        criteria.append(TextStopCriteria(generator.tokenizer, stop_on))
+    if cancelled is not None:
+        criteria.append(CancelledCriteria(cancelled))
+    if criteria:
+        from transformers import StoppingCriteriaList
+        kwargs["stopping_criteria"] = StoppingCriteriaList(criteria)
+    return kwargs
+
+
+def context_length(model):
+    """模型可處理的最大 token 數（gpt2 為 n_positions，其他模型多為 max_position_embeddings）"""
+    config = model.config
+    return getattr(config, "n_positions", None) or getattr(config, "max_position_embeddings", None)
+
+
+def fit_generate_kwargs(generator, prompt_tokens, generate_kwargs):
+    """
+    將 max_new_tokens 限制在上下文長度減去提示詞長度之內
+    提示詞本身已達上下文長度時拋出 ValueError
+    """
+    limit = context_length(generator.model)
+    if not limit:
+        return generate_kwargs
+    room = limit - prompt_tokens
+    if room <= 0:
+        raise ValueError(f"提示詞過長（{prompt_tokens} 個 token，模型上限為 {limit}）")
+    max_new_tokens = generate_kwargs.get("max_new_tokens")
+    if max_new_tokens is not None and max_new_tokens > room:
+        return dict(generate_kwargs, max_new_tokens=room)
+    return generate_kwargs
+
+
+def count_tokens(generator, prompt):
+    """提示詞的 token 數"""
+    return len(generator.tokenizer(prompt).input_ids)
+
+
+# 支援的推論模式：none 為原本的 fp32，int8 為線性層動態量化
+QUANTIZATION_MODES = ("none", "int8")
+
+
+def _conv1d_to_linear(model):
+    """gpt2 的注意力與 MLP 層是 transformers 的 Conv1D（權重為 [in, out]），換成等價的 nn.Linear 才能動態量化"""
+    import torch
+    for parent in list(model.modules()):
+        for name, child in list(parent.named_children()):
+            if type(child).__name__ == "Conv1D":
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return model
+
+
+def quantize_int8(model):
+    """將模型的線性層動態量化為 int8（權重以 int8 儲存，啟動值在推論時動態量化）"""
+    import torch
+    _conv1d_to_linear(model)
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class ModelBackend:
+    """延遲載入的 Hugging Face pipeline，並提供載入狀態"""
+
+    def __init__(self, model_name="gpt2", task="text-generation", prefix_cache_size=32,
+                 quantization="none", num_threads=0):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"不支援的推論模式：{quantization}（可用：{', '.join(QUANTIZATION_MODES)}）")
+        self.model_name = model_name
+        self.task = task
+        self.quantization = quantization
+        # torch 運算子內的執行緒數，0 表示使用 torch 預設值
+        self.num_threads = num_threads
+        # 提示詞前綴 → (前綴 token, past_key_values)；大小為 0 時不重用前綴
+        self.prefix_cache = LRUCache(prefix_cache_size) if prefix_cache_size > 0 else None
+        self.state = "not_loaded"
+        self.error = None
+        self.load_seconds = None
+        self._pipeline = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        # 取樣使用 torch 的全域亂數狀態：未指定 seed 的生成可同時進行，指定 seed 的生成需獨佔
+        self._sampling = threading.Condition()
+        self._unseeded_running = 0
+        self._seeded_waiting = 0
+        self._seeded_running = False
+
+    def _load(self):
+        """載入模型（在背景執行緒或第一次呼叫 get() 時執行）"""
+        started = time.monotonic()
+        try:
+            from transformers import pipeline
+            if self.num_threads:
+                import torch
+                torch.set_num_threads(self.num_threads)
+            generator = pipeline(self.task, model=self.model_name)
+            if self.quantization == "int8":
+                generator.model = quantize_int8(generator.model)
+        except Exception as e:
+            with self._lock:
+                self.state = "failed"
+                self.error = str(e)
+                self._thread = None
+            self._ready.set()
+            return
+
+        with self._lock:
+            self._pipeline = generator
+            self.state = "ready"
+            self.error = None
+            self.load_seconds = round(time.monotonic() - started, 2)
+            self._thread = None
+        self._ready.set()
+
+    def warmup(self):
+        """在背景執行緒載入模型；已載入或載入中時不做任何事"""
+        with self._lock:
+            if self.state in ("ready", "loading"):
+                return
+            self.state = "loading"
+            self.error = None
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._load, name="model-warmup", daemon=True)
+            self._thread.start()
+
+    def get(self, timeout=None):
+        """獲取 pipeline，尚未載入時開始載入並等待，逾時拋出 ModelNotReady"""
+        if self.state != "ready":
+            self.warmup()
+            if not self._ready.wait(timeout):
+                raise ModelNotReady(f"模型 {self.model_name} 載入中")
+            if self.state != "ready":
+                raise ModelNotReady(f"模型 {self.model_name} 載入失敗：{self.error}")
+        return self._pipeline
+
+    @contextlib.contextmanager
+    def sampling(self, seed=None):
+        """
+        生成期間的亂數狀態：seed 為 None 時可與其他未指定 seed 的生成同時進行；
+        指定 seed 時等進行中的生成結束後獨佔全域亂數狀態並設定 seed，相同輸入得到相同結果
+        """
+        with self._sampling:
+            if seed is None:
+                self._sampling.wait_for(lambda: not self._seeded_running and not self._seeded_waiting)
+                self._unseeded_running += 1
+            else:
+                self._seeded_waiting += 1
+                try:
+                    self._sampling.wait_for(lambda: not self._seeded_running and not self._unseeded_running)
+                finally:
+                    self._seeded_waiting -= 1
+                self._seeded_running = True
+        try:
+            if seed is not None:
+                from transformers import set_seed
+                set_seed(seed)
+            yield
+        finally:
+            with self._sampling:
+                if seed is None:
+                    self._unseeded_running -= 1
+                else:
+                    self._seeded_running = False
+                self._sampling.notify_all()
+
+    def can_reuse_prefix(self, prompt, prefix):
+        return bool(prefix) and self.prefix_cache is not None and prompt.startswith(prefix)
+
+    def _prefix_state(self, generator, prefix):
+        """獲取前綴的 token 與 past_key_values，第一次使用時計算並快取"""
+        entry = self.prefix_cache.get(prefix)
+        if entry is None:
+            import torch
+            model = generator.model
+            prefix_ids = generator.tokenizer(prefix, return_tensors="pt").input_ids.to(model.device)
+            with torch.no_grad():
+                past_key_values = model(prefix_ids, use_cache=True).past_key_values
+            entry = (prefix_ids, past_key_values)
+            self.prefix_cache.set(prefix, entry)
+        return entry
+
+    def generate_with_prefix(self, generator, prompt, prefix, streamer=None, cancelled=None, **generate_kwargs):
+        """
+        沿用前綴的 past_key_values 生成單筆請求，只需要計算前綴之後的 token
+        返回新產生的文字（return_full_text 為 True 時包含提示詞）
+        """
+        import torch
+        model = generator.model
+        tokenizer = generator.tokenizer
+        prefix_ids, past_key_values = self._prefix_state(generator, prefix)
+
+        # 前綴與其餘部分分開編碼，確保前綴的 token 與快取一致
+        suffix_ids = tokenizer(
+            prompt[len(prefix):], return_tensors="pt", add_special_tokens=False
+        ).input_ids.to(model.device)
+        input_ids = torch.cat([prefix_ids, suffix_ids], dim=1)
+
+        generate_kwargs = fit_generate_kwargs(generator, input_ids.shape[1], generate_kwargs)
+        kwargs = pipeline_kwargs(generator, generate_kwargs, cancelled)
+        return_full_text = kwargs.pop("return_full_text", True)
+        kwargs.pop("num_return_sequences", None)
+        if tokenizer.pad_token_id is None:
+            kwargs.setdefault("pad_token_id", model.config.eos_token_id)
+
+        # generate 會在快取後面繼續寫入，每次使用複本
+        with torch.no_grad():
+            output = model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=copy.deepcopy(past_key_values),
+                streamer=streamer,
+                **kwargs
+            )
+        text = tokenizer.decode(output[0, input_ids.shape[1]:], skip_special_tokens=True)
+        return prompt + text if return_full_text else text
+
+    def stream(self, prompt, timeout=None, prefix=None, **generate_kwargs):
+        """
+        串流生成：返回逐段產生新文字（不含提示詞）的迭代器
+        模型未就緒時立即拋出 ModelNotReady，生成失敗時在迭代過程中拋出例外
+        迭代器提前關閉（消費端離開）時，生成會在下一個 token 停止
+        """
+        generator = self.get(timeout)
+        from transformers import TextIteratorStreamer
+        streamer = TextIteratorStreamer(generator.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        return self._iter_stream(generator, streamer, prompt, prefix, generate_kwargs)
+
+    def _iter_stream(self, generator, streamer, prompt, prefix, generate_kwargs):
+        errors = []
+        generate_kwargs = dict(generate_kwargs)
+        seed = generate_kwargs.pop("seed", None)
+        cancelled = threading.Event()
+
+        def run():
+            try:
+                with self.sampling(seed):
+                    if self.can_reuse_prefix(prompt, prefix):
+                        self.generate_with_prefix(
+                            generator, prompt, prefix, streamer=streamer, cancelled=cancelled, **generate_kwargs
+                        )
+                    else:
+                        kwargs = fit_generate_kwargs(generator, count_tokens(generator, prompt), generate_kwargs)
+                        generator(prompt, streamer=streamer, **pipeline_kwargs(generator, kwargs, cancelled))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=run, name="model-stream", daemon=True)
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            # 消費端中斷（例如客戶端斷線）時停止生成，不繼續佔用模型
+            cancelled.set()
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    @property
+    def is_ready(self):
+        return self.state == "ready"
+
+    def status(self):
+        """獲取模型載入狀態"""
+        return {
+            "model": self.model_name,
+            "state": self.state,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+            "quantization": self.quantization,
+            "num_threads": self.num_threads,
+            "prefix_cache": self.prefix_cache.stats() if self.prefix_cache is not None else None
+        }
+
+
+class GenerationBatcher:
+    """
+    生成請求的動態批次處理：收集 max_wait_ms 內到達的請求（最多 max_batch_size 個），
+    以一次補齊長度的批量呼叫送進 pipeline，再把結果分派回各個等待中的請求
+    指定 seed 的請求不與其他請求合併（補齊長度與批次組成都會影響取樣結果）
+    """
+
+    def __init__(self, backend, max_batch_size=8, max_wait_ms=10, load_timeout=None):
+        self.backend = backend
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.load_timeout = load_timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._prepared = None
+        self._requests = 0
+        self._batches = 0
+        self._largest_batch = 0
+
+    def _ensure_worker(self):
+        """第一次提交時才啟動批次執行緒"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="generation-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, prompt, timeout=None, prefix=None, **generate_kwargs):
+        """提交一個提示詞並等待生成結果；prefix 為提示詞中可重用 KV 快取的固定前綴"""
+        future = Future()
+        key = tuple(sorted(generate_kwargs.items()))
+        self._ensure_worker()
+        self._queue.put((key, prompt, generate_kwargs, future, prefix))
+        return future.result(timeout)
+
+    def _collect(self):
+        """取出第一個請求後，在等待時間內盡量收集更多請求"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # 生成參數相同的請求才能合併成同一次呼叫
+            groups = {}
+            for item in self._collect():
+                groups.setdefault(item[0], []).append(item)
+            for items in groups.values():
+                if items[0][2].get("seed") is None:
+                    self._run_batch(items)
+                else:
+                    for item in items:
+                        self._run_batch([item])
+
+    def _prepare(self, generator):
+        """批量生成需要補齊長度：沒有 pad token 的模型（如 gpt2）以 eos 補齊，並從左側補齊"""
+        if generator is self._prepared:
+            return
+        tokenizer = getattr(generator, "tokenizer", None)
+        if tokenizer is not None:
+            if tokenizer.pad_token_id is None:
+                tokenizer.pad_token_id = generator.model.config.eos_token_id
+            tokenizer.padding_side = "left"
+        self._prepared = generator
+
+    def _run_batch(self, items):
+        """以一次 pipeline 呼叫處理一組請求"""
+        items = [item for item in items if item[3].set_running_or_notify_cancel()]
+        if not items:
+            return
+
+        with self._lock:
+            self._requests += len(items)
+            self._batches += 1
+            self._largest_batch = max(self._largest_batch, len(items))
+
+        generate_kwargs = dict(items[0][2])
+        seed = generate_kwargs.pop("seed", None)
+        try:
+            generator = self.backend.get(timeout=self.load_timeout)
+            if len(items) == 1 and self.backend.can_reuse_prefix(items[0][1], items[0][4]):
+                # 單筆請求沿用前綴的 KV 快取（補齊長度的批次無法共用同一份快取）
+                _, prompt, _, future, prefix = items[0]
+                with self.backend.sampling(seed):
+                    text = self.backend.generate_with_prefix(generator, prompt, prefix, **generate_kwargs)
+                future.set_result(text)
+                return
+            self._prepare(generator)
+            # 補齊長度後所有提示詞與最長者等長，新產生的 token 數以最長的提示詞計算
+            prompts = [item[1] for item in items]
+            generate_kwargs = fit_generate_kwargs(
+                generator, max(count_tokens(generator, prompt) for prompt in prompts), generate_kwargs
+            )
+            with self.backend.sampling(seed):
+                outputs = generator(prompts, batch_size=len(items), **pipeline_kwargs(generator, generate_kwargs))
+        except Exception as e:
+            for item in items:
+                item[3].set_exception(e)
+            return
+
+        for item, output in zip(items, outputs):
+            # 輸入為列表時每個提示詞返回一個候選列表
+            if isinstance(output, list):
+                output = output[0]
+            item[3].set_result(output["generated_text"])
+
+    def stats(self):
+        """獲取批次處理統計"""
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000),
+                "queued": self._queue.qsize(),
+                "requests": self._requests,
+                "batches": self._batches,
+                "largest_batch": self._largest_batch,
+                "average_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0
+            }
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本機模型服務
+獨立程序持有唯一的 pipeline，多個 Web worker 透過 Unix socket 以 ModelClient 呼叫，
+worker 數量增加時不需要重複載入模型；各 worker 的請求在服務端一起合併批次
+串流生成使用獨立連線，服務端逐段送出 ("chunk", 文字)，最後送出 ("done", None)
+連線的訊息以 pickle 傳遞，因此一律需要驗證金鑰：未設定 MODEL_SERVER_AUTHKEY 時，
+服務啟動時產生隨機金鑰寫入 <socket>.key（只有擁有者可讀寫），同一使用者的 worker 從該檔讀取；
+socket 本身也只有擁有者可連線
+
+啟動方式：MODEL_SERVER_SOCKET=model_server.sock python model_server.py
+"""
+
+import os
+import secrets
+import threading
+from multiprocessing.connection import Client, Listener, AuthenticationError
+
+from model_backend import ModelBackend, ModelNotReady, GenerationBatcher
+
+
+def authkey_path(address):
+    """服務自動產生的驗證金鑰檔路徑"""
+    return address + ".key"
+
+
+def create_authkey(address):
+    """產生隨機驗證金鑰並寫入只有擁有者可讀寫的金鑰檔"""
+    authkey = secrets.token_hex(32).encode()
+    path = authkey_path(address)
+    if os.path.exists(path):
+        os.unlink(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(authkey)
+    return authkey
+
+
+def load_authkey(address):
+    """讀取服務產生的驗證金鑰，金鑰檔不存在時返回 None"""
+    try:
+        with open(authkey_path(address), "rb") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ModelServer:
+    """在 Unix socket 上提供生成與狀態查詢，每個連線由一個執行緒處理"""
+
+    def __init__(self, address, backend, batcher, authkey):
+        if not authkey:
+            raise ValueError("模型服務需要連線驗證金鑰")
+        self.address = address
+        self.backend = backend
+        self.batcher = batcher
+        self.authkey = authkey
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._connections = 0
+
+    def serve_forever(self):
+        """開始監聽並預熱模型"""
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        # socket 建立時即只有擁有者可讀寫（之後再 chmod 會有短暫的可連線空窗）
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family="AF_UNIX", authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        self.backend.warmup()
+        print(f"🧠 模型服務監聽於 {self.address}（模型：{self.backend.model_name}）")
+
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            listener.close()
+
+    def _handle(self, conn):
+        """處理單一連線上的所有請求，直到客戶端關閉連線"""
+        with self._lock:
+            self._connections += 1
+        try:
+            with conn:
+                while True:
+                    try:
+                        message = conn.recv()
+                    except (EOFError, OSError):
+                        return
+                    if message[0] == "stream":
+                        self._stream(conn, message)
+                        return
+                    reply = self._dispatch(message)
+                    try:
+                        conn.send(reply)
+                    except OSError:
+                        return
+        finally:
+            with self._lock:
+                self._connections -= 1
+
+    def _stream(self, conn, message):
+        """逐段送出串流生成的文字，客戶端斷線時停止"""
+        _, prompt, generate_kwargs = message
+        with self._lock:
+            self._pending += 1
+        try:
+            try:
+                chunks = self.backend.stream(prompt, timeout=self.batcher.load_timeout, **generate_kwargs)
+            except ModelNotReady as e:
+                conn.send(("not_ready", str(e)))
+                return
+            try:
+                for text in chunks:
+                    conn.send(("chunk", text))
+            except OSError:
+                return
+            except Exception as e:
+                conn.send(("error", str(e)))
+                return
+            finally:
+                # 客戶端斷線時關閉迭代器，停止生成
+                chunks.close()
+            conn.send(("done", None))
+        except OSError:
+            return
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _dispatch(self, message):
+        """回覆格式：("ok", 結果) / ("not_ready", 訊息) / ("error", 訊息)"""
+        command = message[0]
+        if command == "generate":
+            _, prompt, generate_kwargs = message
+            with self._lock:
+                self._pending += 1
+            try:
+                return ("ok", self.batcher.submit(prompt, **generate_kwargs))
+            except ModelNotReady as e:
+                return ("not_ready", str(e))
+            except Exception as e:
+                return ("error", str(e))
+            finally:
+                with self._lock:
+                    self._pending -= 1
+        if command == "status":
+            return ("ok", self.status())
+        return ("error", f"未知的指令：{command}")
+
+    def status(self):
+        """模型狀態、批次統計與佇列深度"""
+        status = self.backend.status()
+        status["batching"] = self.batcher.stats()
+        with self._lock:
+            status["pending"] = self._pending
+            status["connections"] = self._connections
+        return status
+
+
+class ModelClient:
+    """
+    模型服務的客戶端；每個執行緒保留一條連線，連線失敗或逾時時拋出 ModelNotReady
+    未指定 authkey 時每次連線讀取服務產生的金鑰檔（服務重啟後金鑰會更新）
+    """
+
+    def __init__(self, address, timeout=60, authkey=None):
+        self.address = address
+        self.timeout = timeout
+        self.authkey = authkey
+        self._local = threading.local()
+
+    def _connect(self):
+        authkey = self.authkey or load_authkey(self.address)
+        if not authkey:
+            raise ModelNotReady(f"找不到模型服務的驗證金鑰（{authkey_path(self.address)}）")
+        try:
+            return Client(self.address, family="AF_UNIX", authkey=authkey)
+        except AuthenticationError:
+            raise ModelNotReady("模型服務驗證失敗，請確認 MODEL_SERVER_AUTHKEY 與服務相同")
+
+    def _close(self):
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+    def _call(self, message, timeout):
+        """送出請求並等待回覆；沿用的連線失效時重新連線一次"""
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            reused = conn is not None
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    self._local.conn = conn
+                conn.send(message)
+                if not conn.poll(timeout):
+                    # 逾時後回覆仍可能送達，關閉連線避免之後讀到錯誤的回覆
+                    self._close()
+                    raise ModelNotReady("模型服務回應逾時")
+                return conn.recv()
+            except (OSError, EOFError) as e:
+                self._close()
+                if not reused or attempt:
+                    raise ModelNotReady(f"無法連線到模型服務：{e}")
+
+    def submit(self, prompt, timeout=None, **generate_kwargs):
+        """送出生成請求，返回生成結果"""
+        status, value = self._call(
+            ("generate", prompt, generate_kwargs),
+            self.timeout if timeout is None else timeout
+        )
+        if status == "ok":
+            return value
+        if status == "not_ready":
+            raise ModelNotReady(value)
+        raise RuntimeError(value)
+
+    def stream(self, prompt, timeout=None, **generate_kwargs):
+        """
+        串流生成：返回逐段產生新文字的迭代器，每個串流使用一條獨立連線
+        模型未就緒或無法連線時立即拋出 ModelNotReady
+        """
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            conn = self._connect()
+        except OSError as e:
+            raise ModelNotReady(f"無法連線到模型服務：{e}")
+
+        try:
+            conn.send(("stream", prompt, generate_kwargs))
+            first = self._recv(conn, timeout)
+        except Exception:
+            conn.close()
+            raise
+        if first[0] == "not_ready":
+            conn.close()
+            raise ModelNotReady(first[1])
+        return self._iter_stream(conn, first, timeout)
+
+    def _recv(self, conn, timeout):
+        try:
+            if not conn.poll(timeout):
+                raise ModelNotReady("模型服務回應逾時")
+            return conn.recv()
+        except (OSError, EOFError) as e:
+            raise ModelNotReady(f"模型服務連線中斷：{e}")
+
+    def _iter_stream(self, conn, reply, timeout):
+        with conn:
+            while True:
+                status, value = reply
+                if status == "done":
+                    return
+                if status == "chunk":
+                    yield value
+                else:
+                    raise RuntimeError(value)
+                reply = self._recv(conn, timeout)
+
+    def status(self):
+        """獲取模型服務狀態；服務無法連線時 state 為 unavailable"""
+        try:
+            status, value = self._call(("status",), self.timeout)
+        except ModelNotReady as e:
+            return {"model": None, "state": "unavailable", "error": str(e)}
+        if status != "ok":
+            return {"model": None, "state": "unavailable", "error": value}
+        return value
+
+
+def main():
+    address = os.environ.get("MODEL_SERVER_SOCKET", "model_server.sock")
+    authkey = os.environ.get("MODEL_SERVER_AUTHKEY", "").encode() or create_authkey(address)
+    load_timeout = float(os.environ.get("MODEL_LOAD_TIMEOUT", "60"))
+
+    backend = ModelBackend(
+        os.environ.get("MODEL_NAME", "gpt2"),
+        prefix_cache_size=int(os.environ.get("MODEL_PREFIX_CACHE_SIZE", "32")),
+        quantization=os.environ.get("MODEL_QUANTIZATION", "none"),
+        num_threads=int(os.environ.get("MODEL_TORCH_THREADS", "0"))
+    )
+    batcher = GenerationBatcher(
+        backend,
+        int(os.environ.get("GENERATE_MAX_BATCH_SIZE", "8")),
+        float(os.environ.get("GENERATE_MAX_WAIT_MS", "10")),
+        load_timeout=load_timeout
+    )
+
+    try:
+        ModelServer(address, backend, batcher, authkey).serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 模型服務已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ AI 文案生成工具啟動腳本
 
 import os
 import sys
-from app import app
+from app import app, start_model_warmup
 
 def main():
     """主函數"""
@@ -20,6 +20,10 @@ def main():
         os.environ.setdefault('FLASK_ENV', 'development')
         os.environ.setdefault('FLASK_DEBUG', 'True')
         
+        # reloader 監控程序不載入模型，只在實際服務的子程序背景預熱
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_model_warmup()
+        
         # 啟動應用
         app.run(
             host='0.0.0.0',
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基礎版本與簡化版本共用的中文文案模板與模板生成
+import 時不載入模型，兩個版本的模板引擎都使用這裡的 generate_content_simple
+"""
+
+import os
+
+from template_registry import TemplateRegistry
+
+# 文案模板（風格 → 形式）
+CONTENT_TEMPLATES = {
+    "活潑": {
+        "社群貼文": "🎉 超棒的{title}來啦！{key_points} 快來看看吧！",
+        "Email標題": "🔥 不容錯過：{title}",
+        "完整文章": "親愛的朋友們！{title} 真的超級棒！{key_points} 相信你一定會喜歡的！"
+    },
+    "專業": {
+        "社群貼文": "專業{title}，{key_points}，值得信賴的選擇。",
+        "Email標題": "專業服務：{title}",
+        "完整文章": "我們很榮幸為您介紹{title}。{key_points} 我們的專業團隊將為您提供最優質的服務。"
+    },
+    "學術": {
+        "社群貼文": "研究發現：{title}，{key_points}，具有重要意義。",
+        "Email標題": "學術研究：{title}",
+        "完整文章": "本研究探討了{title}的相關問題。{key_points} 研究結果顯示了重要的學術價值。"
+    },
+    "幽默": {
+        "社群貼文": "😂 聽說{title}超厲害！{key_points} 要不要來試試看？",
+        "Email標題": "😄 有趣的消息：{title}",
+        "完整文章": "哈哈，今天要跟大家分享一個有趣的話題：{title}！{key_points} 保證讓你笑到肚子痛！"
+    }
+}
+
+# 模板註冊表（TEMPLATE_FILE 可指定外部 JSON 模板檔，修改後自動重新載入）
+TEMPLATE_FILE = os.environ.get("TEMPLATE_FILE")
+template_registry = TemplateRegistry(
+    {"中文": CONTENT_TEMPLATES},
+    default_template="這是關於{title}的內容。{key_points}",
+    fallback_language="中文",
+    path=TEMPLATE_FILE
+)
+
+
+def generate_content_simple(decomposition, style, form, length):
+    """使用簡單規則生成文案"""
+    
+    # 選擇模板（註冊表已預先解析回退規則）
+    formatter = template_registry.lookup("中文", style, form)
+    
+    # 填充內容
+    key_points_text = "、".join(decomposition['key_points'][:3])
+    generated_text = formatter(
+        title=decomposition['title_suggestion'],
+        key_points=key_points_text
+    )
+    
+    # 根據長度調整
+    if length == "短":
+        generated_text = generated_text[:100] + "..."
+    elif length == "長":
+        generated_text = generated_text + " 更多詳細內容請關注我們的更新。"
+    
+    return generated_text
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQLite 連線工具
+每個執行緒使用各自的連線，並統一開啟 WAL 模式
+"""
+
+import sqlite3
+import threading
+
+
+class ThreadLocalSQLite:
+    """依執行緒管理 SQLite 連線"""
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def connect(self):
+        """獲取目前執行緒的連線（自動提交模式，交易需自行 BEGIN）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
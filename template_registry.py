@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文案模板註冊表
+啟動時建立一次，將「語言 → 風格 → 形式」的回退規則預先展開成扁平查詢表
+可選擇從外部 JSON 檔案載入模板，檔案修改後自動重新載入
+"""
+
+import json
+import os
+import threading
+import time
+
+
+def _merge_templates(base, override):
+    """將外部模板合併到內建模板上（逐層覆蓋）"""
+    merged = {language: {style: dict(forms) for style, forms in styles.items()}
+              for language, styles in base.items()}
+    for language, styles in override.items():
+        for style, forms in styles.items():
+            merged.setdefault(language, {}).setdefault(style, {}).update(forms)
+    return merged
+
+
+class TemplateRegistry:
+    """模板註冊表，lookup() 返回預先綁定的格式化函數"""
+
+    def __init__(self, templates, default_template, fallback_language=None,
+                 fallback_style=None, languages=(), styles=(), forms=(),
+                 path=None, check_interval=2.0):
+        self.builtin_templates = templates
+        self.default_template = default_template
+        self.fallback_language = fallback_language
+        self.fallback_style = fallback_style
+        self.languages = tuple(languages)
+        self.styles = tuple(styles)
+        self.forms = tuple(forms)
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._templates = templates
+        self._table = {}
+        self._load()
+
+    def _load(self):
+        """讀取外部模板檔案（若有）並重建查詢表"""
+        templates = self.builtin_templates
+        mtime = None
+        if self.path and os.path.exists(self.path):
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                templates = _merge_templates(templates, json.load(f))
+
+        self._templates = templates
+        self._table = self._build_table(templates)
+        self._mtime = mtime
+
+    def _build_table(self, templates):
+        """將所有已知的語言、風格、形式組合預先解析成格式化函數"""
+        languages = set(self.languages) | set(templates)
+        styles = set(self.styles)
+        forms = set(self.forms)
+        for style_templates in templates.values():
+            styles.update(style_templates)
+            for form_templates in style_templates.values():
+                forms.update(form_templates)
+
+        return {
+            (language, style, form): self._resolve(templates, language, style, form).format
+            for language in languages
+            for style in styles
+            for form in forms
+        }
+
+    def _resolve(self, templates, language, style, form):
+        """依回退規則找出模板：語言 → 預設語言，風格 → 預設風格，形式 → 預設模板"""
+        lang_templates = templates.get(language)
+        if lang_templates is None:
+            lang_templates = templates.get(self.fallback_language, {})
+        style_templates = lang_templates.get(style)
+        if style_templates is None:
+            style_templates = lang_templates.get(self.fallback_style, {})
+        return style_templates.get(form, self.default_template)
+
+    def _reload_if_changed(self):
+        """外部模板檔案修改後重新載入（每隔 check_interval 秒檢查一次）"""
+        if not self.path:
+            return
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                try:
+                    self._load()
+                except (OSError, ValueError) as e:
+                    # 檔案格式錯誤時保留舊模板
+                    print(f"⚠️ 模板檔案載入失敗，沿用舊模板：{e}")
+                    self._mtime = mtime
+
+    def lookup(self, language, style, form):
+        """獲取對應的格式化函數，呼叫方式：formatter(title=..., key_points=...)"""
+        self._reload_if_changed()
+        formatter = self._table.get((language, style, form))
+        if formatter is None:
+            formatter = self._resolve(self._templates, language, style, form).format
+        return formatter
@@ -9,6 +9,21 @@ import json
 import time
 import sys
 
+def read_sse_events(response):
+    """讀取 SSE 回應中的所有事件，返回 (event, data) 列表"""
+    events = []
+    event, data = None, None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if event is not None:
+                events.append((event, data))
+            event, data = None, None
+        elif line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+    return events
+
 def test_app():
     """測試應用基本功能"""
     base_url = "http://localhost:5000"
@@ -112,6 +127,58 @@ def test_app():
         print(f"❌ 版本查詢測試失敗: {e}")
         return False
     
+    # 測試6: 測試模型狀態
+    print("\n🤖 測試模型狀態...")
+    try:
+        response = requests.get(f"{base_url}/api/model/status")
+        
+        # 模型未就緒時返回 503（readiness 檢查），兩者都帶有狀態內容
+        if response.status_code in (200, 503) and "state" in response.json():
+            status = response.json()
+            print("✅ 模型狀態查詢正常")
+            print(f"   模型: {status.get('model')}，狀態: {status['state']}")
+        else:
+            print(f"❌ 模型狀態查詢異常: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ 模型狀態測試失敗: {e}")
+        return False
+    
+    # 測試7: 測試串流生成
+    print("\n📡 測試串流生成功能...")
+    try:
+        with requests.post(
+            f"{base_url}/generate/stream",
+            json={
+                "confirmed_id": confirmed_id,
+                "style": "活潑",
+                "form": "社群貼文",
+                "length": "短"
+            },
+            stream=True,
+            timeout=300
+        ) as response:
+            if response.status_code == 503:
+                print("⚠️ 模型尚未就緒，略過串流生成測試")
+                events = None
+            elif response.status_code == 200:
+                events = read_sse_events(response)
+            else:
+                print(f"❌ 串流生成異常: {response.status_code}")
+                return False
+        
+        if events is not None:
+            tokens = [data["text"] for event, data in events if event == "token"]
+            if events and events[-1][0] == "done" and tokens:
+                print("✅ 串流生成正常")
+                print(f"   收到片段: {len(tokens)} 個，版本ID: {events[-1][1]['version_id']}")
+            else:
+                print(f"❌ 串流生成未完成: {events[-1] if events else '沒有事件'}")
+                return False
+    except Exception as e:
+        print(f"❌ 串流生成測試失敗: {e}")
+        return False
+    
     print("\n" + "=" * 50)
     print("🎉 所有測試通過！應用運行正常")
     return True
@@ -6,9 +6,30 @@ AI 文案生成工具增強版本測試腳本
 """
 
 import requests
+import io
 import json
+import os
+import tempfile
 import time
 import sys
+import zipfile
+
+def read_sse_events(response):
+    """讀取 SSE 回應中的所有事件，返回 (event, id, data) 列表（忽略 keep-alive 註解）"""
+    events = []
+    event, event_id, data = None, None, None
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if event is not None:
+                events.append((event, event_id, data))
+            event, event_id, data = None, None, None
+        elif line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("id: "):
+            event_id = int(line[len("id: "):])
+        elif line.startswith("data: "):
+            data = json.loads(line[len("data: "):])
+    return events
 
 def test_enhanced_app():
     """測試增強版本應用基本功能"""
@@ -253,6 +274,85 @@ def test_enhanced_app():
         print(f"❌ 版本查詢測試失敗: {e}")
         return False
     
+    # 測試8: 測試批量結果串流與斷線續傳
+    print("\n📡 測試批量結果串流與斷線續傳...")
+    try:
+        with requests.get(f"{base_url}/batch/{job_id}/stream", stream=True, timeout=60) as response:
+            if response.status_code != 200:
+                print(f"❌ 批量串流異常: {response.status_code}")
+                return False
+            events = read_sse_events(response)
+        
+        result_ids = [event_id for event, event_id, data in events if event == "result"]
+        if result_ids == list(range(len(batch_texts))) and events[-1][0] == "done":
+            print("✅ 批量串流正常")
+            print(f"   收到結果: {len(result_ids)} 筆，最後事件: {events[-1][0]}")
+        else:
+            print(f"❌ 批量串流結果不完整: {result_ids}")
+            return False
+        
+        # 帶 Last-Event-ID 重新連線時，只送出該索引之後的結果
+        with requests.get(
+            f"{base_url}/batch/{job_id}/stream",
+            headers={"Last-Event-ID": "0"},
+            stream=True,
+            timeout=60
+        ) as response:
+            events = read_sse_events(response)
+        
+        resumed_ids = [event_id for event, event_id, data in events if event == "result"]
+        if resumed_ids == list(range(1, len(batch_texts))) and events[-1][0] == "done":
+            print("✅ 斷線續傳正常")
+            print(f"   從索引 1 繼續，收到結果: {len(resumed_ids)} 筆")
+        else:
+            print(f"❌ 斷線續傳異常: {resumed_ids}")
+            return False
+    except Exception as e:
+        print(f"❌ 批量串流測試失敗: {e}")
+        return False
+    
+    # 測試9: 測試版本匯出
+    print("\n📤 測試版本匯出功能...")
+    try:
+        response = requests.get(f"{base_url}/versions/{confirmed_id}/export", params={"format": "zip"})
+        if response.status_code == 200:
+            names = zipfile.ZipFile(io.BytesIO(response.content)).namelist()
+            print("✅ ZIP 匯出正常")
+            print(f"   檔案數量: {len(names)}（版本數量: {len(versions)}）")
+            if len(names) != len(versions):
+                return False
+        else:
+            print(f"❌ ZIP 匯出異常: {response.status_code}")
+            return False
+        
+        response = requests.get(f"{base_url}/versions/{confirmed_id}/export", params={"format": "ndjson"})
+        if response.status_code == 200:
+            lines = [json.loads(line) for line in response.text.splitlines() if line]
+            print("✅ NDJSON 匯出正常")
+            print(f"   紀錄數量: {len(lines)}")
+            if len(lines) != len(versions):
+                return False
+        else:
+            print(f"❌ NDJSON 匯出異常: {response.status_code}")
+            return False
+        
+        response = requests.get(f"{base_url}/versions/{confirmed_id}/export", params={"format": "csv"})
+        if response.status_code == 200 and response.headers["Content-Type"].startswith("text/csv"):
+            print("✅ CSV 匯出正常")
+        else:
+            print(f"❌ CSV 匯出異常: {response.status_code}")
+            return False
+        
+        response = requests.get(f"{base_url}/versions/{confirmed_id}/export", params={"format": "xml"})
+        if response.status_code == 400:
+            print("✅ 不支援的匯出格式正確返回 400")
+        else:
+            print(f"❌ 不支援的匯出格式應返回 400: {response.status_code}")
+            return False
+    except Exception as e:
+        print(f"❌ 版本匯出測試失敗: {e}")
+        return False
+    
     print("\n" + "=" * 60)
     print("🎉 所有測試通過！增強版本應用運行正常")
     print("✨ 新功能測試結果：")
@@ -260,7 +360,118 @@ def test_enhanced_app():
     print("   🎨 擴展風格：✅ 正常")
     print("   📝 擴展形式：✅ 正常")
     print("   📦 批量處理：✅ 正常")
+    print("   📡 批量串流：✅ 正常")
     print("   🔄 版本管理：✅ 正常")
+    print("   📤 版本匯出：✅ 正常")
+    return True
+
+def test_job_store():
+    """測試批量任務儲存（不需要啟動應用）：結果分頁、孤立任務標記失敗、只快取已結束的任務"""
+    from job_store import (
+        MemoryJobStore, SQLiteJobStore, CachedJobStore, JobHeartbeat, ORPHANED_JOB_ERROR
+    )
+    
+    print("\n🗄️ 測試批量任務儲存...")
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+        db_path = os.path.join(tmp, "batch_jobs.db")
+        
+        # 測試1: 結果分頁讀取
+        stores = {
+            "記憶體": MemoryJobStore(),
+            "SQLite + 快取": CachedJobStore(SQLiteJobStore(db_path), 4)
+        }
+        for name, store in stores.items():
+            job_id = f"paging-{name}"
+            store.create({"id": job_id, "status": "processing", "total": 5, "completed": 0, "created_at": "now"})
+            store.append_results(job_id, [{"index": i} for i in range(3)], completed=3)
+            store.append_results(job_id, [{"index": i} for i in range(3, 5)], completed=2)
+            
+            page = [result["index"] for result in store.get_results(job_id, 2, 2)]
+            all_results = [result["index"] for result in store.iter_results(job_id, page_size=2)]
+            job = store.get(job_id, include_results=False)
+            if page == [2, 3] and all_results == list(range(5)) and job["completed"] == 5:
+                print(f"✅ {name}後端分頁讀取正常")
+            else:
+                print(f"❌ {name}後端分頁讀取異常: {page}, {all_results}, {job['completed']}")
+                return False
+        
+        # 測試2: 停止心跳的工作進程留下的未完成任務會被標記為失敗
+        stopped = SQLiteJobStore(db_path, owner="stopped-worker")
+        alive = SQLiteJobStore(db_path, owner="alive-worker")
+        stopped.create({"id": "orphaned", "status": "processing", "total": 1, "completed": 0, "created_at": "now"})
+        alive.create({"id": "running", "status": "processing", "total": 1, "completed": 0, "created_at": "now"})
+        
+        orphaned_calls = []
+        heartbeat = JobHeartbeat(alive, stale_after=0.2, on_orphaned=lambda: orphaned_calls.append(1))
+        time.sleep(0.3)
+        failed = heartbeat.beat()
+        orphaned = alive.get("orphaned", include_results=False)
+        running = alive.get("running", include_results=False)
+        if (failed >= 1 and orphaned_calls and orphaned["status"] == "failed"
+                and orphaned["error"] == ORPHANED_JOB_ERROR and running["status"] == "processing"):
+            print("✅ 孤立任務標記為失敗，存活進程的任務不受影響")
+        else:
+            print(f"❌ 孤立任務處理異常: {orphaned['status']}, {running['status']}")
+            return False
+        
+        # 測試3: 快取只保存已結束的任務
+        cached = CachedJobStore(SQLiteJobStore(db_path), 4)
+        cached.create({"id": "cached", "status": "processing", "total": 1, "completed": 0, "created_at": "now"})
+        cached.get("cached")
+        running_size = cached.stats()["size"]
+        cached.update("cached", status="completed")
+        cached.get("cached")
+        cached.get("cached")
+        stats = cached.stats()
+        if running_size == 0 and stats["size"] == 1 and stats["hits"] >= 1:
+            print("✅ 快取只保存已結束的任務")
+            print(f"   快取統計: {stats['size']} 筆，命中 {stats['hits']} 次")
+        else:
+            print(f"❌ 快取行為異常: {running_size}, {stats}")
+            return False
+    
+    return True
+
+def test_admission_control():
+    """測試准入控制（不需要啟動應用）：名額與佇列都滿時返回 429 + Retry-After"""
+    from flask import Flask
+    from admission_control import ConcurrencyLimiter
+    from app_common import create_common_blueprint
+    from version_store import VersionRepository
+    
+    print("\n🚦 測試准入控制...")
+    limiter = ConcurrencyLimiter("generate", max_concurrent=1, max_queue=0, retry_after=2)
+    app = Flask(__name__)
+    app.register_blueprint(create_common_blueprint(VersionRepository(), lambda: {"generate": limiter.stats()}))
+    
+    @app.route("/work")
+    @limiter.limit
+    def work():
+        return "ok"
+    
+    client = app.test_client()
+    started = limiter.acquire()
+    try:
+        response = client.get("/work")
+    finally:
+        limiter.release(started)
+    
+    if response.status_code == 429 and response.headers.get("Retry-After") == "2":
+        print("✅ 名額已滿時返回 429")
+        print(f"   Retry-After: {response.headers['Retry-After']}")
+    else:
+        print(f"❌ 名額已滿時應返回 429: {response.status_code}")
+        return False
+    
+    response = client.get("/work")
+    stats = client.get("/api/admission/stats").get_json()["generate"]
+    if response.status_code == 200 and stats["rejected"] == 1 and stats["active"] == 0:
+        print("✅ 名額釋放後恢復處理")
+        print(f"   准入統計: 通過 {stats['admitted']} 次，拒絕 {stats['rejected']} 次")
+    else:
+        print(f"❌ 名額釋放後處理異常: {response.status_code}, {stats}")
+        return False
+    
     return True
 
 def main():
@@ -280,7 +491,7 @@ def main():
     # 等待用戶確認
     input("按 Enter 鍵開始測試...")
     
-    success = test_enhanced_app()
+    success = test_enhanced_app() and test_job_store() and test_admission_control()
     
     if success:
         print("\n✨ 測試完成，增強版本應用功能正常！")
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文字清理
+三個版本共用的文字正規化：去除特殊字符並合併空白
+每段文字只做一次字元刪除（ASCII 文字用 str.translate 查表，其他用預先編譯的正則），
+再以 split/join 同時合併空白與去除首尾空白
+"""
+
+import re
+
+# 保留的字元：文字、數字、底線、空白、中文與常用中文標點
+ALLOWED_CHARS = r'\w\s\u4e00-\u9fff。，！？；："（）【】'
+DISALLOWED_RE = re.compile(f'[^{ALLOWED_CHARS}]+')
+
+# 多段文字一次清理時使用的分隔字元（不在保留字元內，不會出現在清理結果中）
+_BATCH_SEPARATOR = "\x00"
+_BATCH_DISALLOWED_RE = re.compile(f'[^{ALLOWED_CHARS}{_BATCH_SEPARATOR}]+')
+
+# ASCII 字元的刪除表（str.translate 對純 ASCII 文字有快速路徑）
+_ASCII_DELETE_TABLE = {
+    code: None
+    for code in range(128)
+    if DISALLOWED_RE.match(chr(code))
+}
+_BATCH_ASCII_DELETE_TABLE = {
+    code: None for code in _ASCII_DELETE_TABLE if code != ord(_BATCH_SEPARATOR)
+}
+
+
+def _delete_disallowed(text, ascii_table, pattern):
+    """刪除不保留的字元"""
+    if text.isascii():
+        return text.translate(ascii_table)
+    return pattern.sub('', text)
+
+
+def clean_text(text):
+    """清理文字，去除多餘空格和亂碼"""
+    # split() 會同時合併連續空白並去除首尾空白
+    return " ".join(_delete_disallowed(text, _ASCII_DELETE_TABLE, DISALLOWED_RE).split())
+
+
+def clean_texts(texts):
+    """一次清理多段文字，返回與輸入順序相同的列表"""
+    texts = list(texts)
+    if not texts:
+        return []
+
+    joined = _BATCH_SEPARATOR.join(texts)
+    if joined.count(_BATCH_SEPARATOR) != len(texts) - 1:
+        # 文字本身含有分隔字元時逐段清理
+        return [clean_text(text) for text in texts]
+
+    # 整批刪除一次後再依分隔字元切開
+    cleaned = _delete_disallowed(joined, _BATCH_ASCII_DELETE_TABLE, _BATCH_DISALLOWED_RE)
+    return [" ".join(part.split()) for part in cleaned.split(_BATCH_SEPARATOR)]
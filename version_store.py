@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+版本紀錄儲存
+以 confirmed_id 建立索引，查詢某個拆解內容的版本時不需掃描所有版本
+"""
+
+import threading
+
+
+class VersionRepository:
+    """版本紀錄儲存，維護 confirmed_id → 版本 id（依建立順序）的索引"""
+
+    def __init__(self):
+        self._versions = {}
+        self._by_confirmed_id = {}
+        self._lock = threading.Lock()
+
+    def add(self, version):
+        """新增版本紀錄"""
+        with self._lock:
+            self._versions[version["id"]] = version
+            self._by_confirmed_id.setdefault(version["confirmed_id"], []).append(version["id"])
+
+    def get(self, version_id, default=None):
+        """依版本 id 讀取版本紀錄"""
+        return self._versions.get(version_id, default)
+
+    def by_confirmed_id(self, confirmed_id):
+        """獲取特定拆解內容的所有版本（依建立順序）"""
+        with self._lock:
+            version_ids = list(self._by_confirmed_id.get(confirmed_id, ()))
+        return [self._versions[version_id] for version_id in version_ids]
+
+    def latest(self, confirmed_id):
+        """獲取特定拆解內容的最新版本，沒有版本時返回 None"""
+        with self._lock:
+            version_ids = self._by_confirmed_id.get(confirmed_id)
+            return self._versions[version_ids[-1]] if version_ids else None
+
+    def values(self):
+        return list(self._versions.values())
+
+    def __getitem__(self, version_id):
+        return self._versions[version_id]
+
+    def __contains__(self, version_id):
+        return version_id in self._versions
+
+    def __len__(self):
+        return len(self._versions)